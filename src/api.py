@@ -1,134 +1,237 @@
 # ----- required imports -----
 
-from src.cache import get_cache, set_cache
-from src.client import APIClient
+from typing import List, Dict, Any, Awaitable, Callable, Optional, Set
+from src.cache import get_or_fetch, get_or_fetch_many, refresh_many
+from src.client import ObjectArrayParser, http_client
+import asyncio
 import os
 
 # ----- environment initialization -----
 
 STEAM_KEY = os.getenv('STEAM_API_KEY')
 
+# Overridable to point the bot at a local stand-in (see tests/fake_server.py)
+STEAM_API_BASE_URL = os.getenv('STEAM_API_BASE_URL', 'https://api.steampowered.com')
+STEAM_STORE_BASE_URL = os.getenv('STEAM_STORE_BASE_URL', 'https://store.steampowered.com')
+
+# Seconds to wait for concurrent lookups to join a batch, and Steam's IDs-per-call limit
+STEAM_BATCH_WINDOW = float(os.getenv('STEAM_BATCH_WINDOW', '0.01'))
+PLAYER_SUMMARIES_BATCH_SIZE = 100
+
+# The only GetOwnedGames fields the bot reads; everything else is dropped while parsing
+OWNED_GAME_FIELDS = ('appid', 'name', 'playtime_forever', 'rtime_last_played')
+
 # ----- class definitions -----
 
+class BatchLoader:
+    """
+    Collects keys requested within a short window and loads them together
+
+    The first load() of a batch starts a `window`-second timer; every key
+    requested until it fires (or until max_batch keys are pending) is
+    loaded with one load_many(keys) call, which returns a dict of results.
+    Keys missing from that dict resolve to None. Concurrent loads of the
+    same key share one result.
+    """
+
+    def __init__(
+        self,
+        load_many: Callable[[List[Any]], Awaitable[Dict[Any, Any]]],
+        max_batch: int,
+        window: float = STEAM_BATCH_WINDOW
+    ):
+        self.load_many = load_many
+        self.max_batch = max_batch
+        self.window = window
+        self._pending: Dict[Any, asyncio.Future] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def load(self, key: Any) -> Any:
+        future = self._pending.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._pending[key] = future
+            if len(self._pending) >= self.max_batch:
+                self._dispatch()
+            elif self._timer is None:
+                self._timer = loop.call_later(self.window, self._dispatch)
+        # A cancelled caller must not cancel the result other callers share
+        return await asyncio.shield(future)
+
+    def _dispatch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, {}
+
+        task = asyncio.create_task(self._load_batch(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _load_batch(self, batch: Dict[Any, asyncio.Future]):
+        try:
+            results = await self.load_many(list(batch))
+        except Exception as e:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for key, future in batch.items():
+            if not future.done():
+                future.set_result(results.get(key))
+
 class SteamAPI:
+    api_base_url = STEAM_API_BASE_URL
+    store_base_url = STEAM_STORE_BASE_URL
+
+    @staticmethod
+    async def _fetch_owned_games(steam_id):
+        """Owned games, projected to OWNED_GAME_FIELDS as the response streams in"""
+        return await http_client.get(
+            f"{SteamAPI.api_base_url}/IPlayerService/GetOwnedGames/v1/",
+            params={
+                'key': STEAM_KEY,
+                'steamid': steam_id,
+                'include_appinfo': 1,
+                'include_played_free_games': 0
+            },
+            stream=lambda: ObjectArrayParser('games', OWNED_GAME_FIELDS)
+        )
+
     @staticmethod
     async def get_owned_games(steam_id):
-        cache_key = f"steam_games:{steam_id}"
-        if cached := await get_cache(cache_key):
-            return cached
-        
-        async with APIClient() as client:
-            data = await client.get(
-                "https://api.steampowered.com/IPlayerService/GetOwnedGames/v1/",
-                params={
-                    'key': STEAM_KEY,
-                    'steamid': steam_id,
-                    'include_appinfo': 1,
-                    'include_played_free_games': 0
-                }
-            )
-        games = data['response'].get('games', [])
-        await set_cache(cache_key, games)
-        return games
+        return await get_or_fetch(
+            f"steam_games:{steam_id}",
+            lambda: SteamAPI._fetch_owned_games(steam_id)
+        )
+
+    @staticmethod
+    async def get_owned_games_many(
+        steam_ids: List[str],
+        return_exceptions: bool = False
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Get owned games for many users in one cache round trip, fetching only the misses
+
+        With return_exceptions, a library that could not be fetched maps to
+        its exception instead of failing the whole lookup.
+        """
+        keys = {f"steam_games:{steam_id}": steam_id for steam_id in steam_ids}
+        libraries = await get_or_fetch_many(
+            keys,
+            lambda key: SteamAPI._fetch_owned_games(keys[key]),
+            return_exceptions=return_exceptions
+        )
+        return {keys[key]: games for key, games in libraries.items()}
+
+    @staticmethod
+    async def refresh_owned_games_many(
+        steam_ids: List[str],
+        return_exceptions: bool = False
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """Fetch owned games from Steam even if cached, updating the cache"""
+        keys = {f"steam_games:{steam_id}": steam_id for steam_id in steam_ids}
+        libraries = await refresh_many(
+            keys,
+            lambda key: SteamAPI._fetch_owned_games(keys[key]),
+            return_exceptions=return_exceptions
+        )
+        return {keys[key]: games for key, games in libraries.items()}
+
+    @staticmethod
+    async def _fetch_player_summaries(steam_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        data = await http_client.get(
+            f"{SteamAPI.api_base_url}/ISteamUser/GetPlayerSummaries/v2/",
+            params={'key': STEAM_KEY, 'steamids': ','.join(steam_ids)}
+        )
+        return {player['steamid']: player for player in data['response']['players']}
 
     @staticmethod
     async def get_player_summaries(steam_ids):
-        cache_key = f"player_summaries:{','.join(steam_ids)}"
-        if cached := await get_cache(cache_key):
-            return cached
-
-        async with APIClient() as client:
-            data = await client.get(
-                "https://api.steampowered.com/ISteamUser/GetPlayerSummaries/v2/",
-                params={'key': STEAM_KEY, 'steamids': ','.join(steam_ids)}
-            )
+        """
+        Get player summaries, cached per Steam ID
+
+        Misses from all concurrent callers are fetched together, one request
+        per 100 IDs. IDs Steam does not know are left out of the result.
+        """
+        keys = {f"player_summaries:{steam_id}": steam_id for steam_id in steam_ids}
+        summaries = await get_or_fetch_many(
+            keys,
+            lambda key: player_summary_loader.load(keys[key])
+        )
+        return [summaries[key] for key in keys if summaries[key]]
 
-        players = data['response']['players']
-        await set_cache(cache_key, players, ttl=300)
-        return players
+    @staticmethod
+    async def fetch_game_details(appid: int) -> Optional[Dict[str, Any]]:
+        """Uncached Store API details; None when the Store has no such app"""
+        data = await http_client.get(
+            f"{SteamAPI.store_base_url}/api/appdetails",
+            params={'appids': appid}
+        )
+        if str(appid) in data and data[str(appid)]['success']:
+            return data[str(appid)]['data']
+        return None
 
     @staticmethod
     async def get_game_details(appid: int):
         """Get detailed game information from Steam Store API"""
-        cache_key = f"game_details:{appid}"
-        if cached := await get_cache(cache_key):
-            return cached
-
-        async with APIClient() as client:
-            try:
-                data = await client.get(
-                    f"https://store.steampowered.com/api/appdetails",
-                    params={'appids': appid}
-                )
-                if str(appid) in data and data[str(appid)]['success']:
-                    game_data = data[str(appid)]['data']
-                    await set_cache(cache_key, game_data, ttl=86400)  # Cache for 24 hours
-                    return game_data
-            except Exception as e:
-                print(f"Error fetching game details for {appid}: {e}")
-        return None
+        return await get_or_fetch(
+            f"game_details:{appid}",
+            lambda: SteamAPI.fetch_game_details(appid)
+        )
 
     @staticmethod
     async def get_player_achievements(steam_id: str, appid: int):
         """Get player achievements for a specific game"""
-        cache_key = f"achievements:{steam_id}:{appid}"
-        if cached := await get_cache(cache_key):
-            return cached
-
-        async with APIClient() as client:
-            try:
-                data = await client.get(
-                    "https://api.steampowered.com/ISteamUserStats/GetPlayerAchievements/v1/",
-                    params={
-                        'key': STEAM_KEY,
-                        'steamid': steam_id,
-                        'appid': appid
-                    }
-                )
-                achievements = data.get('playerstats', {}).get('achievements', [])
-                await set_cache(cache_key, achievements, ttl=3600)
-                return achievements
-            except Exception as e:
-                print(f"Error fetching achievements: {e}")
-                return []
+        async def fetch():
+            data = await http_client.get(
+                f"{SteamAPI.api_base_url}/ISteamUserStats/GetPlayerAchievements/v1/",
+                params={
+                    'key': STEAM_KEY,
+                    'steamid': steam_id,
+                    'appid': appid
+                }
+            )
+            return data.get('playerstats', {}).get('achievements', [])
+
+        return await get_or_fetch(f"achievements:{steam_id}:{appid}", fetch)
 
     @staticmethod
     async def get_recently_played_games(steam_id: str):
         """Get recently played games for a user"""
-        cache_key = f"recent_games:{steam_id}"
-        if cached := await get_cache(cache_key):
-            return cached
-
-        async with APIClient() as client:
-            data = await client.get(
-                "https://api.steampowered.com/IPlayerService/GetRecentlyPlayedGames/v1/",
+        async def fetch():
+            data = await http_client.get(
+                f"{SteamAPI.api_base_url}/IPlayerService/GetRecentlyPlayedGames/v1/",
                 params={
                     'key': STEAM_KEY,
                     'steamid': steam_id
                 }
             )
-        games = data['response'].get('games', [])
-        await set_cache(cache_key, games, ttl=300)  # Cache for 5 minutes
-        return games
+            return data['response'].get('games', [])
+
+        return await get_or_fetch(f"recent_games:{steam_id}", fetch)
 
     @staticmethod
     async def resolve_vanity_url(vanity_url: str) -> str:
         """Resolve Steam vanity URL to Steam ID"""
-        cache_key = f"vanity:{vanity_url}"
-        if cached := await get_cache(cache_key):
-            return cached
-
-        async with APIClient() as client:
-            data = await client.get(
-                "https://api.steampowered.com/ISteamUser/ResolveVanityURL/v1/",
+        async def fetch():
+            data = await http_client.get(
+                f"{SteamAPI.api_base_url}/ISteamUser/ResolveVanityURL/v1/",
                 params={
                     'key': STEAM_KEY,
                     'vanityurl': vanity_url
                 }
             )
 
-        if data['response']['success'] == 1:
-            steam_id = data['response']['steamid']
-            await set_cache(cache_key, steam_id, ttl=86400)
-            return steam_id
-        return None
\ No newline at end of file
+            if data['response']['success'] == 1:
+                return data['response']['steamid']
+            return None
+
+        return await get_or_fetch(f"vanity:{vanity_url}", fetch)
+
+# ----- global batch loader instances -----
+
+player_summary_loader = BatchLoader(SteamAPI._fetch_player_summaries, PLAYER_SUMMARIES_BATCH_SIZE)
@@ -1,20 +1,880 @@
 # ----- required imports -----
 
-from aiocache import RedisCache
-from aiocache.serializers import JsonSerializer
+from aiocache import RedisCache, SimpleMemoryCache
+from aiocache.base import BaseCache
+from aiocache.serializers import BaseSerializer, JsonSerializer
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+from urllib.parse import urlparse
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import time
+import uuid
+import zlib
+import msgpack
+from src.metrics import Histogram, LATENCY_BUCKETS_MS, SIZE_BUCKETS_BYTES
+
+# ----- environment initialization -----
+
+BACKEND = os.getenv('CACHE_BACKEND', 'redis')  # 'redis' or 'memory'
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+REDIS_POOL_SIZE = int(os.getenv('CACHE_POOL_SIZE', '50'))
+REDIS_CONNECT_TIMEOUT = float(os.getenv('CACHE_CONNECT_TIMEOUT', '5'))
+MEMORY_MAX_SIZE = int(os.getenv('CACHE_MEMORY_MAX_SIZE', '10000'))
+NAMESPACE = "discord_steam_bot"
+L1_MAX_SIZE = int(os.getenv('CACHE_L1_MAX_SIZE', '0'))  # 0 disables the in-process tier
+L1_TTL = float(os.getenv('CACHE_L1_TTL', '60'))
+INVALIDATION_CHANNEL = f"{NAMESPACE}:invalidate"
+INSTANCE_ID = uuid.uuid4().hex
+DISTRIBUTED_LOCKS = os.getenv('CACHE_DISTRIBUTED_LOCKS', 'false').lower() == 'true'
+LOCK_TTL = float(os.getenv('CACHE_LOCK_TTL', '10'))
+LOCK_POLL_INTERVAL = 0.1
+STALE_FACTOR = float(os.getenv('CACHE_STALE_FACTOR', '1.0'))  # stale window as a fraction of the TTL
+XFETCH_BETA = float(os.getenv('CACHE_XFETCH_BETA', '1.0'))  # > 1 favours earlier refreshes
+ENVELOPE_KEY = "__cached__"
+SERIALIZER = os.getenv('CACHE_SERIALIZER', 'compact')  # 'compact' (msgpack) or 'json'
+COMPRESS_THRESHOLD = int(os.getenv('CACHE_COMPRESS_THRESHOLD', '1024'))  # bytes
+
+# Base TTLs per cache key prefix; the TTL policy adapts them per key
+BASE_TTLS = {
+    'steam_games': 3600,
+    'player_summaries': 300,
+    'game_details': 86400,
+    'achievements': 3600,
+    'recent_games': 300,
+    'vanity': 86400,
+    'price': 900,
+    'price_history': 3600,
+    'deals': 900,
+}
+DEFAULT_TTL = 3600
+ADAPTIVE_TTL = os.getenv('CACHE_ADAPTIVE_TTL', 'true').lower() == 'true'
+TTL_MIN = int(os.getenv('CACHE_TTL_MIN', '60'))
+TTL_MAX = int(os.getenv('CACHE_TTL_MAX', '604800'))  # one week
+
+# TTLs for empty (not found) lookups, keyed by cache key prefix; fetch errors are never cached
+NEGATIVE_TTLS = {
+    'steam_games': 600,  # private profiles and empty libraries
+    'player_summaries': 60,
+    'game_details': 3600,  # delisted or region-locked apps
+    'achievements': 600,
+    'recent_games': 300,
+    'vanity': 300,
+    'price': 300,
+    'price_history': 600,
+    'deals': 60,
+}
+DEFAULT_NEGATIVE_TTL = 60
+
+# Returned by get_cache for absent keys when passed as the default
+MISSING = object()
 
 # ----- class definitions -----
 
-cache = RedisCache(
-    endpoint='localhost',
-    port=6379,
-    namespace="discord_steam_bot",
-    serializer=JsonSerializer(),
-    timeout=5
+class CacheEntry(NamedTuple):
+    """A cached value with the bookkeeping stored next to it"""
+    value: Any
+    soft_expiry: float
+    delta: float  # seconds the value took to fetch
+    ttl: Optional[float] = None  # TTL the value was written with
+    digest: Optional[str] = None  # fingerprint used to detect changes on refresh
+
+class TTLPolicy:
+    """
+    Central TTLs per key family that adapt per key to how often values change
+
+    Every refresh compares the new value's fingerprint with the previous
+    entry's. Unchanged values are kept longer next time and changed ones
+    shorter, within [base * min_factor, base * max_factor] and the global
+    min/max bounds.
+    """
+
+    def __init__(
+        self,
+        base_ttls: Dict[str, int],
+        default_ttl: int = 3600,
+        min_ttl: int = 60,
+        max_ttl: int = 604800,
+        growth: float = 1.5,
+        decay: float = 0.5,
+        min_factor: float = 0.25,
+        max_factor: float = 8.0,
+        adaptive: bool = True
+    ):
+        self.base_ttls = base_ttls
+        self.default_ttl = default_ttl
+        self.min_ttl = min_ttl
+        self.max_ttl = max_ttl
+        self.growth = growth
+        self.decay = decay
+        self.min_factor = min_factor
+        self.max_factor = max_factor
+        self.adaptive = adaptive
+
+    def base_ttl(self, key: str) -> int:
+        return self.base_ttls.get(key_family(key), self.default_ttl)
+
+    def fingerprint(self, key: str, value: Any) -> str:
+        """Hash of the part of a value whose changes should shorten its TTL"""
+        if key_family(key) == 'steam_games':
+            # Playtime moves constantly; only purchases change what a library is
+            value = sorted(game['appid'] for game in value)
+        packed = msgpack.packb(value, use_bin_type=True)
+        return hashlib.blake2b(packed, digest_size=8).hexdigest()
+
+    def next_ttl(
+        self,
+        key: str,
+        digest: str,
+        previous: Optional[CacheEntry],
+        base: Optional[int] = None
+    ) -> int:
+        """TTL for a freshly fetched value, given the entry it replaces"""
+        base = base or self.base_ttl(key)
+        if not self.adaptive or previous is None or previous.ttl is None or previous.digest is None:
+            ttl = base
+        elif previous.digest == digest:
+            ttl = previous.ttl * self.growth
+        else:
+            ttl = previous.ttl * self.decay
+
+        lower = max(self.min_ttl, base * self.min_factor)
+        upper = min(self.max_ttl, base * self.max_factor)
+        return int(min(max(ttl, lower), max(upper, lower)))
+
+class LocalCache:
+    """Bounded in-process LRU cache with per-entry TTL"""
+
+    def __init__(self, max_size: int = 1024, ttl: float = 60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict = OrderedDict()
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return a live entry and mark it as most recently used"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        """Store an entry, never outliving the local TTL, and evict the LRU tail"""
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+
+        self._entries[key] = (value, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: str):
+        """Drop a single entry"""
+        self._entries.pop(key, None)
+
+    def clear(self):
+        """Drop every entry"""
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+class CompactSerializer(BaseSerializer):
+    """
+    msgpack serializer that zlib-compresses payloads above a size threshold
+
+    Every payload starts with a one-byte format marker. Neither marker can
+    start a JSON document, so entries written by JsonSerializer are still
+    read correctly.
+    """
+
+    DEFAULT_ENCODING = None
+    MSGPACK = b'\x01'
+    MSGPACK_ZLIB = b'\x02'
+
+    def __init__(self, *args, compress_threshold: int = 1024, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.compress_threshold = compress_threshold
+
+    def dumps(self, value: Any) -> bytes:
+        packed = msgpack.packb(value, use_bin_type=True)
+        if len(packed) > self.compress_threshold:
+            return self.MSGPACK_ZLIB + zlib.compress(packed)
+        return self.MSGPACK + packed
+
+    def loads(self, value: Optional[bytes]) -> Any:
+        if value is None:
+            return None
+
+        marker, payload = value[:1], value[1:]
+        if marker == self.MSGPACK:
+            return msgpack.unpackb(payload, raw=False)
+        if marker == self.MSGPACK_ZLIB:
+            return msgpack.unpackb(zlib.decompress(payload), raw=False)
+        # Legacy JSON entry
+        return json.loads(value)
+
+def create_serializer(name: str = SERIALIZER) -> BaseSerializer:
+    """Build the cache serializer selected by CACHE_SERIALIZER"""
+    if name == 'json':
+        return JsonSerializer()
+    if name == 'compact':
+        return CompactSerializer(compress_threshold=COMPRESS_THRESHOLD)
+    raise ValueError(f"Unknown cache serializer: {name}")
+
+class MemoryCache(SimpleMemoryCache):
+    """
+    In-process cache backend for Redis-free runs, tests and benchmarks
+
+    TTLs behave as on the Redis backend, and once max_size keys are held the
+    least recently used one is evicted, like Redis under an allkeys-lru
+    maxmemory policy.
+    """
+
+    def __init__(self, max_size: int = 10000, **kwargs):
+        super().__init__(**kwargs)
+        self.max_size = max_size
+        self._cache = OrderedDict()
+
+    async def _get(self, key, encoding="utf-8", _conn=None):
+        if key in self._cache:
+            self._cache.move_to_end(key)
+        return self._cache.get(key)
+
+    async def _multi_get(self, keys, encoding="utf-8", _conn=None):
+        return [await self._get(key) for key in keys]
+
+    async def _set(self, key, value, ttl=None, _cas_token=None, _conn=None):
+        result = await super()._set(key, value, ttl=ttl, _cas_token=_cas_token, _conn=_conn)
+        if key in self._cache:
+            self._cache.move_to_end(key)
+        while len(self._cache) > self.max_size:
+            await self._delete(next(iter(self._cache)))
+        return result
+
+    async def _clear(self, namespace=None, _conn=None):
+        result = await super()._clear(namespace, _conn=_conn)
+        self._cache = OrderedDict(self._cache)
+        return result
+
+def create_cache(backend: str = BACKEND) -> BaseCache:
+    """Build the cache backend selected by CACHE_BACKEND"""
+    if backend == 'memory':
+        return MemoryCache(
+            max_size=MEMORY_MAX_SIZE,
+            namespace=NAMESPACE,
+            serializer=create_serializer(),
+            timeout=5
+        )
+    if backend == 'redis':
+        url = urlparse(REDIS_URL)
+        return RedisCache(
+            endpoint=url.hostname or 'localhost',
+            port=url.port or 6379,
+            db=int(url.path.lstrip('/') or 0),
+            password=url.password,
+            pool_max_size=REDIS_POOL_SIZE,
+            create_connection_timeout=REDIS_CONNECT_TIMEOUT,
+            namespace=NAMESPACE,
+            serializer=create_serializer(),
+            timeout=5
+        )
+    raise ValueError(f"Unknown cache backend: {backend}")
+
+class CacheMetrics:
+    """Lookup outcomes, backend latency and stored value sizes per key family"""
+
+    def __init__(self):
+        self.families: Dict[str, Dict[str, Any]] = {}
+
+    def _stats(self, family: str) -> Dict[str, Any]:
+        if family not in self.families:
+            self.families[family] = {
+                'hits': 0,
+                'stale_hits': 0,
+                'misses': 0,
+                'local_hits': 0,  # subset of hits served by the in-process tier
+                'sets': 0,
+                'get_latency_ms': Histogram(LATENCY_BUCKETS_MS),
+                'set_latency_ms': Histogram(LATENCY_BUCKETS_MS),
+                'value_size_bytes': Histogram(SIZE_BUCKETS_BYTES),
+            }
+        return self.families[family]
+
+    def record_lookup(self, key: str, outcome: str):
+        """Count a 'hits', 'stale_hits' or 'misses' outcome"""
+        self._stats(key_family(key))[outcome] += 1
+
+    def record_local_hit(self, key: str):
+        self._stats(key_family(key))['local_hits'] += 1
+
+    def record_get(self, keys: Iterable[str], seconds: float):
+        """Record one backend read, once per key family it touched"""
+        for family in {key_family(key) for key in keys}:
+            self._stats(family)['get_latency_ms'].observe(seconds * 1000)
+
+    def record_set(self, sizes: Dict[str, int], seconds: float):
+        """Record one backend write of keys with the given payload sizes"""
+        for key, size in sizes.items():
+            stats = self._stats(key_family(key))
+            stats['sets'] += 1
+            stats['value_size_bytes'].observe(size)
+        for family in {key_family(key) for key in sizes}:
+            self._stats(family)['set_latency_ms'].observe(seconds * 1000)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Point-in-time copy of every family's counters and histogram summaries"""
+        snapshot = {}
+        for family, stats in sorted(self.families.items()):
+            lookups = stats['hits'] + stats['stale_hits'] + stats['misses']
+            snapshot[family] = {
+                name: value.snapshot() if isinstance(value, Histogram) else value
+                for name, value in stats.items()
+            }
+            snapshot[family]['hit_ratio'] = (
+                (stats['hits'] + stats['stale_hits']) / lookups if lookups else 0.0
+            )
+        return snapshot
+
+    def reset(self):
+        self.families.clear()
+
+def key_family(key: str) -> str:
+    """Key prefix used to group keys, e.g. 'steam_games' for 'steam_games:<id>'"""
+    return key.split(':', 1)[0]
+
+def _is_redis() -> bool:
+    """Pub/sub and locks only exist, and are only needed, on the shared Redis backend"""
+    return isinstance(cache, RedisCache)
+
+def redis_client():
+    """Underlying redis.asyncio client when the shared Redis backend is active, else None"""
+    return cache.client if _is_redis() else None
+
+cache = create_cache()
+cache_metrics = CacheMetrics()
+
+local_cache = LocalCache(max_size=L1_MAX_SIZE, ttl=L1_TTL) if L1_MAX_SIZE > 0 else None
+
+ttl_policy = TTLPolicy(
+    BASE_TTLS,
+    default_ttl=DEFAULT_TTL,
+    min_ttl=TTL_MIN,
+    max_ttl=TTL_MAX,
+    adaptive=ADAPTIVE_TTL
 )
 
-async def get_cache(key):
-    return await cache.get(key)
+_invalidation_task: Optional[asyncio.Task] = None
+_inflight: Dict[str, asyncio.Future] = {}
+_refresh_tasks: Set[asyncio.Task] = set()
+
+# ----- entry envelope -----
+
+def _wrap(value: Any, ttl: float, delta: float, digest: Optional[str] = None) -> Dict[str, Any]:
+    """Store the soft expiry, recompute time and TTL bookkeeping next to the value"""
+    return {
+        ENVELOPE_KEY: value,
+        'soft_expiry': time.time() + ttl,
+        'delta': delta,
+        'ttl': ttl,
+        'digest': digest
+    }
+
+def _unwrap(raw: Any) -> Optional[CacheEntry]:
+    """Decode a stored envelope; pre-envelope entries never go stale"""
+    if raw is None:
+        return None
+    if isinstance(raw, dict) and ENVELOPE_KEY in raw:
+        return CacheEntry(
+            raw[ENVELOPE_KEY],
+            raw['soft_expiry'],
+            raw['delta'],
+            raw.get('ttl'),
+            raw.get('digest')
+        )
+    return CacheEntry(raw, float('inf'), 0.0)
+
+def _hard_ttl(ttl: float) -> int:
+    """Backend TTL: keep values past their soft expiry so they can be served stale"""
+    return int(ttl * (1 + STALE_FACTOR))
+
+def _should_refresh(soft_expiry: float, delta: float) -> bool:
+    """
+    XFetch early expiry: refresh with a probability that rises as the soft
+    expiry approaches and with how long the value took to compute, so keys
+    written together do not all expire together
+    """
+    # 1 - random() is in (0, 1], keeping log() finite
+    jitter = delta * XFETCH_BETA * -math.log(1.0 - random.random())
+    return time.time() + jitter >= soft_expiry
+
+def _classify(key: str, entry: Optional[CacheEntry], now: float, serve_stale: bool):
+    """Record and return the lookup outcome for an entry"""
+    if entry is None:
+        outcome = 'misses'
+    elif now < entry.soft_expiry:
+        outcome = 'hits'
+    else:
+        outcome = 'stale_hits' if serve_stale else 'misses'
+    cache_metrics.record_lookup(key, outcome)
+    return outcome
+
+def _serialize(pairs: List[Tuple[str, Any]]) -> List[Tuple[str, Any]]:
+    """Serialize up front so stored sizes can be measured"""
+    return [(key, cache.serializer.dumps(value)) for key, value in pairs]
+
+def _identity(value: Any) -> Any:
+    return value
+
+async def _get_fresh(key: str) -> Any:
+    """get_cache without lookup metrics, for internal polling"""
+    entry = await _get_entry(key)
+    if entry is None or time.time() >= entry.soft_expiry:
+        return MISSING
+    return entry.value
+
+async def _get_entry(key: str) -> Optional[CacheEntry]:
+    if local_cache is not None and (entry := local_cache.get(key)) is not None:
+        cache_metrics.record_local_hit(key)
+        return entry
+
+    start = time.perf_counter()
+    raw = await cache.get(key)
+    cache_metrics.record_get([key], time.perf_counter() - start)
+
+    entry = _unwrap(raw)
+    if local_cache is not None and entry is not None:
+        local_cache.set(key, entry)
+    return entry
+
+async def _get_entries(keys: List[str]) -> Dict[str, CacheEntry]:
+    """Read many entries, going to the backend once for everything not held locally"""
+    entries = {}
+    remote_keys = []
+    for key in keys:
+        if local_cache is not None and (entry := local_cache.get(key)) is not None:
+            cache_metrics.record_local_hit(key)
+            entries[key] = entry
+        else:
+            remote_keys.append(key)
+
+    if remote_keys:
+        start = time.perf_counter()
+        raws = await cache.multi_get(remote_keys)
+        cache_metrics.record_get(remote_keys, time.perf_counter() - start)
+
+        for key, raw in zip(remote_keys, raws):
+            entry = _unwrap(raw)
+            if entry is None:
+                continue
+            entries[key] = entry
+            if local_cache is not None:
+                local_cache.set(key, entry)
+    return entries
+
+# ----- public cache api -----
+
+async def get_cache(key, default=None):
+    """
+    Return a value that has not passed its soft expiry
+
+    Cached empty results come back as stored, so pass default=MISSING to
+    tell them apart from absent keys.
+    """
+    entry = await _get_entry(key)
+    if _classify(key, entry, time.time(), serve_stale=False) != 'hits':
+        return default
+    return entry.value
+
+async def set_cache(key, value, ttl=3600, delta=0.0):
+    await _write(key, _wrap(value, ttl, delta))
+
+async def _write(key: str, envelope: Dict[str, Any]):
+    hard_ttl = _hard_ttl(envelope['ttl'])
+    [(_, payload)] = _serialize([(key, envelope)])
+
+    start = time.perf_counter()
+    await cache.set(key, payload, ttl=hard_ttl, dumps_fn=_identity)
+    cache_metrics.record_set({key: len(payload)}, time.perf_counter() - start)
+
+    if local_cache is not None:
+        local_cache.set(key, _unwrap(envelope), ttl=hard_ttl)
+        if _is_redis():
+            await _publish_invalidation([key])
+
+async def get_cache_many(keys: Iterable[str]) -> Dict[str, Any]:
+    """Like get_cache for many keys in one round trip; absent or soft-expired keys are omitted"""
+    keys = list(dict.fromkeys(keys))
+    now = time.time()
+    entries = await _get_entries(keys)
+    return {
+        key: entries[key].value
+        for key in keys
+        if _classify(key, entries.get(key), now, serve_stale=False) == 'hits'
+    }
+
+async def set_cache_many(items: Dict[str, Any], ttl=3600, delta=0.0):
+    """Like set_cache for many keys, pipelining the writes"""
+    await _write_many([(key, _wrap(value, ttl, delta)) for key, value in items.items()])
+
+async def _write_many(items: List[Tuple[str, Dict[str, Any]]]):
+    """Write (key, envelope) pairs with one pipelined write per distinct TTL"""
+    by_ttl: Dict[int, List[Tuple[str, Dict[str, Any]]]] = {}
+    for key, envelope in items:
+        by_ttl.setdefault(_hard_ttl(envelope['ttl']), []).append((key, envelope))
+
+    for hard_ttl, pairs in by_ttl.items():
+        payloads = _serialize(pairs)
+
+        start = time.perf_counter()
+        await cache.multi_set(payloads, ttl=hard_ttl, dumps_fn=_identity)
+        cache_metrics.record_set(
+            {key: len(payload) for key, payload in payloads},
+            time.perf_counter() - start
+        )
+        if local_cache is not None:
+            for key, envelope in pairs:
+                local_cache.set(key, _unwrap(envelope), ttl=hard_ttl)
+
+    if local_cache is not None and items and _is_redis():
+        await _publish_invalidation([key for key, _ in items])
+
+async def get_or_fetch(key: str, fetch: Callable[[], Awaitable[Any]], ttl: Optional[int] = None):
+    """
+    Return a cached value, or fetch and cache it once on a miss
+
+    The TTL comes from the TTL policy, with ttl overriding the family's base.
+
+    Values past their soft expiry (or picked for early refresh) are returned
+    immediately while a background refresh runs. Concurrent misses on the
+    same key share a single in-flight fetch, and with CACHE_DISTRIBUTED_LOCKS
+    enabled so do misses across processes. Empty results (None, [], {})
+    are cached too, with the shorter negative TTL of their key family, so
+    fetch must raise on errors rather than return an empty value; a failed
+    fetch stores nothing and a stale entry stays in place.
+    """
+    entry = await _get_entry(key)
+    _classify(key, entry, time.time(), serve_stale=True)
+    if entry is not None:
+        if _should_refresh(entry.soft_expiry, entry.delta):
+            _schedule_refresh(key, fetch, ttl, entry)
+        return entry.value
+    return await singleflight(key, lambda: _fetch_and_store(key, fetch, ttl, None))
+
+async def get_or_fetch_many(
+    keys: Iterable[str],
+    fetch: Callable[[str], Awaitable[Any]],
+    ttl: Optional[int] = None,
+    return_exceptions: bool = False
+) -> Dict[str, Any]:
+    """
+    Batch version of get_or_fetch
+
+    All keys are read in one round trip. Only the misses are fetched, via
+    fetch(key) run concurrently, and the ones that succeed are written back
+    in one pipelined batch, so one failing key does not discard the others.
+    A failure is raised once every other miss has been stored, or with
+    return_exceptions the exception is returned as that key's value
+    instead. Stale hits are served and refreshed in the background.
+    """
+    keys = list(dict.fromkeys(keys))
+    entries = await _get_entries(keys)
+
+    results = {}
+    misses = []
+    now = time.time()
+    for key in keys:
+        entry = entries.get(key)
+        _classify(key, entry, now, serve_stale=True)
+        if entry is None:
+            misses.append(key)
+            continue
+        if _should_refresh(entry.soft_expiry, entry.delta):
+            _schedule_refresh(key, lambda key=key: fetch(key), ttl, entry)
+        results[key] = entry.value
+
+    if misses:
+        results.update(await _fetch_many(misses, fetch, ttl, {}, return_exceptions))
+
+    return results
+
+async def refresh_many(
+    keys: Iterable[str],
+    fetch: Callable[[str], Awaitable[Any]],
+    ttl: Optional[int] = None,
+    return_exceptions: bool = False
+) -> Dict[str, Any]:
+    """
+    Fetch keys from the source even if they are cached, storing each result
+
+    For callers that must know a value is current, such as when syncing a
+    copy kept elsewhere. Failures are handled as in get_or_fetch_many and
+    leave the cached entry in place.
+    """
+    keys = list(dict.fromkeys(keys))
+    entries = await _get_entries(keys)
+    return await _fetch_many(keys, fetch, ttl, entries, return_exceptions, force=True)
+
+async def _fetch_many(
+    keys: List[str],
+    fetch: Callable[[str], Awaitable[Any]],
+    ttl: Optional[int],
+    previous: Dict[str, CacheEntry],
+    return_exceptions: bool,
+    force: bool = False
+) -> Dict[str, Any]:
+    """
+    Fetch keys concurrently and store the ones that succeed
+
+    The results are written back in one pipelined batch. With distributed
+    locks each key is instead fetched and stored under its own lock, and
+    force makes sure the source is called rather than another process's
+    cached result being reused.
+    """
+    if DISTRIBUTED_LOCKS and _is_redis():
+        values = await asyncio.gather(
+            *[
+                singleflight(
+                    key,
+                    lambda key=key: _fetch_and_store(key, lambda: fetch(key), ttl, previous.get(key), force)
+                )
+                for key in keys
+            ],
+            return_exceptions=True
+        )
+    else:
+        start = time.monotonic()
+        values = await asyncio.gather(
+            *[singleflight(key, lambda key=key: fetch(key)) for key in keys],
+            return_exceptions=True
+        )
+        delta = time.monotonic() - start
+        await _write_many([
+            (key, _envelope_for(key, value, ttl, delta, previous.get(key)))
+            for key, value in zip(keys, values)
+            if not isinstance(value, BaseException)
+        ])
+
+    if not return_exceptions:
+        for value in values:
+            if isinstance(value, BaseException):
+                raise value
+    return dict(zip(keys, values))
+
+def _schedule_refresh(
+    key: str,
+    fetch: Callable[[], Awaitable[Any]],
+    ttl: Optional[int],
+    previous: CacheEntry
+):
+    """Refresh a key in the background, at most once at a time per process"""
+    if key in _inflight:
+        return
+
+    async def refresh():
+        from src.client import BACKGROUND, request_deadline, request_priority
+
+        # Detached from the request that triggered it: low priority, no deadline
+        try:
+            with request_priority(BACKGROUND), request_deadline(None):
+                await singleflight(key, lambda: _fetch_and_store(key, fetch, ttl, previous))
+        except Exception as e:
+            print(f"Error refreshing cache key {key}: {e}")
+
+    task = asyncio.create_task(refresh())
+    _refresh_tasks.add(task)
+    task.add_done_callback(_refresh_tasks.discard)
+
+# ----- request coalescing -----
+
+async def singleflight(key: str, fetch: Callable[[], Awaitable[Any]]):
+    """
+    Run fetch once per key, sharing its result with concurrent callers
+
+    The shared fetch runs without a deadline, so the caller that started it
+    does not impose its budget on the others; each caller instead stops
+    waiting when its own deadline runs out.
+    """
+    from src.client import DeadlineExceeded, remaining_time, request_deadline
+
+    future = _inflight.get(key)
+    if future is None:
+        with request_deadline(None):
+            future = asyncio.ensure_future(fetch())
+        _inflight[key] = future
+        future.add_done_callback(lambda _: _inflight.pop(key, None))
+
+    remaining = remaining_time()
+    timeout = None if remaining == float('inf') else max(remaining, 0)
+    try:
+        # A cancelled or timed out caller must not cancel the fetch other callers are awaiting
+        return await asyncio.wait_for(asyncio.shield(future), timeout)
+    except asyncio.TimeoutError:
+        if future.done():
+            raise
+        raise DeadlineExceeded(f"Ran out of time waiting for {key}") from None
+
+def negative_ttl(key: str) -> int:
+    """TTL for an empty (not found) lookup of this key's family"""
+    return NEGATIVE_TTLS.get(key_family(key), DEFAULT_NEGATIVE_TTL)
+
+def _envelope_for(
+    key: str,
+    value: Any,
+    ttl: Optional[int],
+    delta: float,
+    previous: Optional[CacheEntry]
+) -> Dict[str, Any]:
+    """Envelope for a fetched value, with its TTL chosen by the TTL policy"""
+    if not value:
+        return _wrap(value, negative_ttl(key), delta)
+
+    digest = ttl_policy.fingerprint(key, value)
+    return _wrap(value, ttl_policy.next_ttl(key, digest, previous, base=ttl), delta, digest)
+
+async def _fetch_value(
+    key: str,
+    fetch: Callable[[], Awaitable[Any]],
+    ttl: Optional[int],
+    previous: Optional[CacheEntry]
+):
+    start = time.monotonic()
+    value = await fetch()
+    await _write(key, _envelope_for(key, value, ttl, time.monotonic() - start, previous))
+    return value
+
+async def _fetch_and_store(
+    key: str,
+    fetch: Callable[[], Awaitable[Any]],
+    ttl: Optional[int],
+    previous: Optional[CacheEntry],
+    force: bool = False
+):
+    if not DISTRIBUTED_LOCKS or not _is_redis():
+        return await _fetch_value(key, fetch, ttl, previous)
+
+    lock_key = cache.build_key(f"lock:{key}")
+    token = uuid.uuid4().hex
+
+    # A forced fetch must reach the source, so it never settles for a cached value
+    if not await _acquire_lock(lock_key, token) and not force:
+        # Another process is fetching; wait for its result instead of piling on
+        value = await _wait_for_value(key, lock_key)
+        if value is not MISSING:
+            return value
+
+    try:
+        # The previous holder may have refreshed the key just before we got the lock
+        if not force and (cached := await _get_fresh(key)) is not MISSING:
+            return cached
+        return await _fetch_value(key, fetch, ttl, previous)
+    finally:
+        await _release_lock(lock_key, token)
+
+async def _acquire_lock(lock_key: str, token: str) -> bool:
+    try:
+        return bool(await cache.client.set(lock_key, token, nx=True, px=int(LOCK_TTL * 1000)))
+    except Exception as e:
+        print(f"Error acquiring cache lock {lock_key}: {e}")
+        return True
+
+async def _release_lock(lock_key: str, token: str):
+    try:
+        await cache.client.eval(cache.RELEASE_SCRIPT, 1, lock_key, token)
+    except Exception as e:
+        print(f"Error releasing cache lock {lock_key}: {e}")
+
+async def _wait_for_value(key: str, lock_key: str):
+    """Poll for a value while another process holds the fetch lock"""
+    deadline = time.monotonic() + LOCK_TTL
+    while time.monotonic() < deadline:
+        await asyncio.sleep(LOCK_POLL_INTERVAL)
+        if (cached := await _get_fresh(key)) is not MISSING:
+            return cached
+        try:
+            if not await cache.client.exists(lock_key):
+                return await _get_fresh(key)
+        except Exception:
+            return MISSING
+    return MISSING
+
+# ----- dashboards -----
+
+async def backend_info() -> Dict[str, Any]:
+    """Describe the active backend and local tier for dashboards"""
+    info = {
+        'backend': 'redis' if _is_redis() else 'memory',
+        'local_keys': len(local_cache) if local_cache is not None else None,
+    }
+    if _is_redis():
+        memory = await cache.client.info("memory")
+        info['used_memory'] = memory.get('used_memory_human')
+        info['keys'] = await cache.client.dbsize()
+    else:
+        info['keys'] = len(cache._cache)
+    return info
+
+# ----- cross-replica invalidation -----
+
+async def _publish_invalidation(keys: List[str]):
+    """Tell other replicas to drop their local copy of some keys"""
+    try:
+        await cache.client.publish(
+            INVALIDATION_CHANNEL,
+            json.dumps({'origin': INSTANCE_ID, 'keys': keys})
+        )
+    except Exception as e:
+        print(f"Error publishing cache invalidation for {keys}: {e}")
+
+async def _listen_for_invalidations():
+    """Drop local entries overwritten by other replicas"""
+    while True:
+        try:
+            pubsub = cache.client.pubsub()
+            await pubsub.subscribe(INVALIDATION_CHANNEL)
+            # Anything written while we were disconnected may be stale
+            local_cache.clear()
+
+            async for message in pubsub.listen():
+                if message.get('type') != 'message':
+                    continue
+                payload = json.loads(message['data'])
+                if payload.get('origin') != INSTANCE_ID:
+                    for key in payload['keys']:
+                        local_cache.invalidate(key)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Cache invalidation listener error: {e}")
+            await asyncio.sleep(5)
+
+def start_invalidation_listener():
+    """Start the pub/sub listener that keeps the local tier coherent"""
+    global _invalidation_task
+    if local_cache is None or not _is_redis():
+        return
+    if _invalidation_task is None or _invalidation_task.done():
+        _invalidation_task = asyncio.create_task(_listen_for_invalidations())
 
-async def set_cache(key, value, ttl=3600):
-    await cache.set(key, value, ttl=ttl)
\ No newline at end of file
+async def stop_invalidation_listener():
+    """Stop the pub/sub listener"""
+    global _invalidation_task
+    if _invalidation_task is not None:
+        _invalidation_task.cancel()
+        try:
+            await _invalidation_task
+        except asyncio.CancelledError:
+            pass
+        _invalidation_task = None
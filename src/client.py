@@ -1,37 +1,663 @@
 # ----- required imports -----
 
-from aiohttp import ClientSession, TCPConnector
-from aiohttp_retry import RetryClient, ExponentialRetry
+from aiohttp import ClientError, ClientResponseError, ClientSession, ClientTimeout, TCPConnector
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlparse
+from src.cache import NAMESPACE, redis_client
+from src.metrics import Histogram, LATENCY_BUCKETS_MS
 import asyncio
+import heapq
+import itertools
+import json
+import os
+import re
+import time
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# ----- environment initialization -----
+
+HTTP_POOL_LIMIT = int(os.getenv('HTTP_POOL_LIMIT', '100'))
+HTTP_POOL_LIMIT_PER_HOST = int(os.getenv('HTTP_POOL_LIMIT_PER_HOST', '20'))
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv('HTTP_KEEPALIVE_TIMEOUT', '60'))
+HTTP_DNS_TTL = int(os.getenv('HTTP_DNS_TTL', '300'))
+HTTP_TIMEOUT = float(os.getenv('HTTP_TIMEOUT', '30'))
+HTTP_RETRY_ATTEMPTS = int(os.getenv('HTTP_RETRY_ATTEMPTS', '3'))
+HTTP_RETRY_BACKOFF = float(os.getenv('HTTP_RETRY_BACKOFF', '0.5'))
+# A retry is only started if at least this many seconds of the deadline remain
+HTTP_RETRY_MIN_TIME = float(os.getenv('HTTP_RETRY_MIN_TIME', '1'))
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('BREAKER_FAILURE_THRESHOLD', '5'))
+BREAKER_RESET_TIMEOUT = float(os.getenv('BREAKER_RESET_TIMEOUT', '30'))
+
+# Response decoding: 'orjson' (used when installed) or the stdlib 'json'
+JSON_DECODER = os.getenv('JSON_DECODER', 'orjson')
+HTTP_STREAM_CHUNK_SIZE = int(os.getenv('HTTP_STREAM_CHUNK_SIZE', '65536'))
+
+def create_json_loads(name: str = JSON_DECODER) -> Callable[[Any], Any]:
+    """JSON decoder selected by JSON_DECODER"""
+    if name == 'orjson' and orjson is not None:
+        return orjson.loads
+    return json.loads
+
+json_loads = create_json_loads()
+
+VERSION_SEGMENT = re.compile(r'v\d+')
+
+def api_name(url: str) -> str:
+    """Logical API of a URL: its last non-version path segment, e.g. 'GetOwnedGames'"""
+    parsed = urlparse(url)
+    segments = [s for s in parsed.path.split('/') if s and not VERSION_SEGMENT.fullmatch(s)]
+    return segments[-1] if segments else parsed.hostname
+
+def _rate_limit_from_env(name: str, default: str) -> Tuple[float, int]:
+    """Parse '<requests per second>,<burst>' from the environment"""
+    rate, burst = os.getenv(name, default).split(',')
+    return float(rate), int(burst)
+
+# Share buckets across replicas through Redis when it is the cache backend
+RATE_LIMIT_SHARED = os.getenv('RATE_LIMIT_SHARED', 'true').lower() == 'true'
+
+# Requests per second and burst size per bucket
+RATE_LIMITS = {
+    'steam_api': _rate_limit_from_env('RATE_LIMIT_STEAM_API', '5,20'),
+    'steam_appdetails': _rate_limit_from_env('RATE_LIMIT_STEAM_APPDETAILS', '0.6,5'),
+    'itad': _rate_limit_from_env('RATE_LIMIT_ITAD', '5,10')
+}
+
+# First (host, path prefix) match picks the bucket; other hosts are not limited
+RATE_LIMIT_ROUTES = [
+    ('store.steampowered.com', '/api/appdetails', 'steam_appdetails'),
+    ('api.steampowered.com', '/', 'steam_api'),
+    ('api.isthereanydeal.com', '/', 'itad')
+]
+
+# ----- request priority -----
+
+INTERACTIVE = 0
+BACKGROUND = 1
+
+_priority: ContextVar[int] = ContextVar('request_priority', default=INTERACTIVE)
+
+@contextmanager
+def request_priority(priority: int):
+    """Send requests made in this block (and tasks it starts) through the given lane"""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+# ----- request deadlines -----
+
+_deadline: ContextVar[Optional[float]] = ContextVar('request_deadline', default=None)
+
+def _deadline_after(seconds: Optional[float]) -> Optional[float]:
+    """Deadline `seconds` from now, never later than the one already in effect"""
+    if seconds is None:
+        return None
+    deadline = time.monotonic() + seconds
+    current = _deadline.get()
+    return deadline if current is None else min(current, deadline)
+
+@contextmanager
+def request_deadline(seconds: Optional[float]):
+    """
+    Bound the time requests in this block may take, retries included
+
+    Deadlines nest by taking the earliest one. None lifts the deadline, for
+    detached work such as background refreshes.
+    """
+    token = _deadline.set(_deadline_after(seconds))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+def set_request_deadline(seconds: float):
+    """Bound the time requests may take for the rest of the current task"""
+    _deadline.set(_deadline_after(seconds))
+
+def remaining_time() -> float:
+    """Seconds left before the current deadline (infinite without one)"""
+    deadline = _deadline.get()
+    return float('inf') if deadline is None else deadline - time.monotonic()
+
+def _timeout_for(remaining: float) -> Optional[float]:
+    """asyncio timeout for a remaining time, None meaning no deadline"""
+    return None if remaining == float('inf') else max(remaining, 0)
+
+# ----- exceptions -----
+
+class UpstreamUnavailable(Exception):
+    """A request was not attempted because it could not succeed in time"""
+
+class CircuitOpenError(UpstreamUnavailable):
+    """The endpoint's circuit breaker is open"""
+
+class DeadlineExceeded(UpstreamUnavailable):
+    """The request deadline has passed"""
 
 # ----- class definitions -----
 
-class APIClient:
+class TokenBucket:
+    """
+    Token bucket that grants tokens strictly by priority lane
+
+    Waiters queue by (lane, arrival) and one dispatcher hands each refilled
+    token to the oldest waiter in the most urgent lane, so background work
+    only gets tokens no interactive request is waiting for. When shared and
+    the cache backend is Redis, the bucket state lives in Redis and every
+    replica draws from the same quota; if Redis fails the local state is used.
+    """
+
+    TAKE_SCRIPT = """
+    local rate = tonumber(ARGV[1])
+    local capacity = tonumber(ARGV[2])
+    local clock = redis.call('TIME')
+    local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+    local tokens = tonumber(state[1]) or capacity
+    local updated = tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+    local wait = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+    else
+        wait = (1 - tokens) / rate
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+    redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 60)
+    return tostring(wait)
+    """
+
+    def __init__(self, name: str, rate: float, capacity: int, shared: bool = RATE_LIMIT_SHARED):
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity
+        self.shared = shared
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+    async def acquire(self, priority: Optional[int] = None):
+        """Wait for a token in the caller's lane (the current request_priority by default)"""
+        if not self._waiters and await self._take() == 0:
+            return
+
+        if priority is None:
+            priority = _priority.get()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        await future
+
+    async def _dispatch(self):
+        while self._prune():
+            wait = await self._take()
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            if self._prune():
+                _, _, future = heapq.heappop(self._waiters)
+                future.set_result(None)
+
+    def _prune(self) -> bool:
+        """Drop cancelled waiters from the head of the queue; True if any remain"""
+        while self._waiters and self._waiters[0][2].done():
+            heapq.heappop(self._waiters)
+        return bool(self._waiters)
+
+    async def _take(self) -> float:
+        """Take one token; returns 0 on success, else seconds until one refills"""
+        client = redis_client() if self.shared else None
+        if client is not None:
+            try:
+                wait = await client.eval(
+                    self.TAKE_SCRIPT, 1, f"{NAMESPACE}:ratelimit:{self.name}",
+                    self.rate, self.capacity
+                )
+                return float(wait)
+            except Exception as e:
+                print(f"Error using shared rate limit {self.name}, using local bucket: {e}")
+
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+class RateLimiter:
+    """Routes each request URL to the token bucket of its host or endpoint"""
+
+    def __init__(
+        self,
+        limits: Dict[str, Tuple[float, int]] = RATE_LIMITS,
+        routes: List[Tuple[str, str, str]] = RATE_LIMIT_ROUTES,
+        shared: bool = RATE_LIMIT_SHARED
+    ):
+        self.buckets = {
+            name: TokenBucket(name, rate, capacity, shared)
+            for name, (rate, capacity) in limits.items()
+        }
+        self.routes = routes
+
+    def bucket_for(self, url: str) -> Optional[TokenBucket]:
+        parsed = urlparse(url)
+        for host, prefix, name in self.routes:
+            if parsed.hostname == host and parsed.path.startswith(prefix):
+                return self.buckets.get(name)
+        return None
+
+    async def acquire(self, url: str, priority: Optional[int] = None):
+        bucket = self.bucket_for(url)
+        if bucket is not None:
+            await bucket.acquire(priority)
+
+class ObjectArrayParser:
+    """
+    Incremental parser that projects the objects of one JSON array
+
+    Feed it the response body chunk by chunk. The complete elements of the
+    array under `key` in each chunk are decoded in one loads() call and
+    reduced to `fields` right away, so neither the full body nor a full tree
+    of every element is ever held at once.
+    """
+
+    START = re.compile(rb'"(?P<key>[^"\\]+)"\s*:\s*\[')
+    # A '}' inside a string only fails to decode; give up after this many and wait for more data
+    MAX_BOUNDARY_ATTEMPTS = 4
+
+    def __init__(self, key: str, fields: Iterable[str], loads: Callable[[Any], Any] = None):
+        self.key = key.encode()
+        self.fields = tuple(fields)
+        self.loads = loads or json_loads
+        self.items: List[Dict[str, Any]] = []
+        self._buffer = b''
+        self._in_array = False
+        self._done = False
+
+    def feed(self, chunk: bytes):
+        if self._done:
+            return
+        self._buffer += chunk
+
+        if not self._in_array:
+            for match in self.START.finditer(self._buffer):
+                if match.group('key') == self.key:
+                    self._buffer = self._buffer[match.end():]
+                    self._in_array = True
+                    break
+            else:
+                # Keep only a tail long enough to hold a key split across chunks
+                self._buffer = self._buffer[-(len(self.key) + 64):]
+                return
+
+        self._consume(self.MAX_BOUNDARY_ATTEMPTS)
+
+    def _consume(self, attempts: int):
+        """Decode the longest prefix of the buffer that is a run of whole elements"""
+        self._buffer = self._buffer.lstrip(b' \t\r\n,')
+        end = len(self._buffer)
+        while attempts > 0 and not self._buffer.startswith(b']'):
+            attempts -= 1
+            end = self._buffer.rfind(b'}', 0, end)
+            if end < 0:
+                return
+            try:
+                items = self.loads(b'[' + self._buffer[:end + 1] + b']')
+            except ValueError:
+                continue
+            self.items.extend(
+                {field: item[field] for field in self.fields if field in item}
+                for item in items
+            )
+            self._buffer = self._buffer[end + 1:].lstrip(b' \t\r\n,')
+            break
+
+        if self._buffer.startswith(b']'):
+            self._done = True
+            self._buffer = b''
+
+    def close(self) -> List[Dict[str, Any]]:
+        """Projected items; an absent array yields none, a truncated one raises"""
+        if self._in_array and not self._done:
+            self._consume(self._buffer.count(b'}'))
+        if self._in_array and not self._done:
+            raise ValueError(f"Unterminated JSON array {self.key.decode()!r}")
+        return self.items
+
+class HTTPMetrics:
+    """Outbound request outcomes, latency and bytes received per logical API"""
+
     def __init__(self):
-        self.connector = TCPConnector(
-            limit=100,
-            limit_per_host=20,
-            enable_cleanup_closed=True
-        )
-        self.retry_options = ExponentialRetry(
-            attempts=3,
-            factor=2,
-            statuses={429, 500, 502, 503, 504}
-        )
+        self.apis: Dict[str, Dict[str, Any]] = {}
+
+    def _stats(self, api: str) -> Dict[str, Any]:
+        if api not in self.apis:
+            self.apis[api] = {
+                'requests': 0,  # attempts actually sent, retries included
+                'retries': 0,
+                'statuses': {},
+                'errors': {},  # attempts that got no response, by error type
+                'circuit_open': 0,  # calls failed fast by the circuit breaker
+                'deadline_exceeded': 0,
+                'bytes_received': 0,
+                'latency_ms': Histogram(LATENCY_BUCKETS_MS),
+                'rate_limit_wait_ms': Histogram(LATENCY_BUCKETS_MS),
+            }
+        return self.apis[api]
+
+    def record_response(self, api: str, status: int, seconds: float, size: int):
+        stats = self._stats(api)
+        stats['requests'] += 1
+        stats['statuses'][str(status)] = stats['statuses'].get(str(status), 0) + 1
+        stats['bytes_received'] += size
+        stats['latency_ms'].observe(seconds * 1000)
+
+    def record_error(self, api: str, error: str, seconds: float):
+        stats = self._stats(api)
+        stats['requests'] += 1
+        stats['errors'][error] = stats['errors'].get(error, 0) + 1
+        stats['latency_ms'].observe(seconds * 1000)
+
+    def record_retry(self, api: str):
+        self._stats(api)['retries'] += 1
+
+    def record_rejected(self, api: str, reason: str):
+        """Count a call that was never sent: 'circuit_open' or 'deadline_exceeded'"""
+        self._stats(api)[reason] += 1
+
+    def record_rate_limit_wait(self, api: str, seconds: float):
+        self._stats(api)['rate_limit_wait_ms'].observe(seconds * 1000)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Point-in-time copy of every API's counters and histogram summaries"""
+        snapshot = {}
+        for api, stats in sorted(self.apis.items()):
+            snapshot[api] = {
+                name: value.snapshot() if isinstance(value, Histogram) else
+                dict(value) if isinstance(value, dict) else value
+                for name, value in stats.items()
+            }
+            failures = sum(stats['errors'].values()) + sum(
+                count for status, count in stats['statuses'].items()
+                if int(status) in RETRY_STATUSES
+            )
+            snapshot[api]['failure_ratio'] = failures / stats['requests'] if stats['requests'] else 0.0
+        return snapshot
+
+    def reset(self):
+        self.apis.clear()
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker for one endpoint
+
+    After failure_threshold failures in a row the breaker opens and calls
+    fail fast for reset_timeout seconds. Then one probe request is let
+    through (half-open): success closes the breaker, failure reopens it.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+        reset_timeout: float = BREAKER_RESET_TIMEOUT
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_started: Optional[float] = None
+
+    def allow(self) -> bool:
+        """Whether a request may be sent now"""
+        now = time.monotonic()
+        if self.state == 'open':
+            if now - self.opened_at < self.reset_timeout:
+                return False
+            self.state = 'half_open'
+            self.probe_started = None
+
+        if self.state == 'half_open':
+            # A probe that never reported back (e.g. cancelled) expires
+            if self.probe_started is not None and now - self.probe_started < self.reset_timeout:
+                return False
+            self.probe_started = now
+        return True
+
+    def record_success(self):
+        self.state = 'closed'
+        self.failures = 0
+        self.probe_started = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == 'half_open' or self.failures >= self.failure_threshold:
+            self.state = 'open'
+            self.opened_at = time.monotonic()
+            self.probe_started = None
+
+    def release(self):
+        """End a request that says nothing about the endpoint, freeing the probe slot"""
+        self.probe_started = None
+
+class APIClient:
+    """
+    HTTP client backed by one keep-alive connection pool
+
+    The shared http_client instance lives for the whole process: start() it
+    on startup and close() it on shutdown so every request reuses pooled
+    connections instead of paying a new TCP+TLS handshake. Ad-hoc instances
+    can still be used with `async with`, which closes them on exit.
+
+    Every attempt waits for a rate limiter token in its lane and passes the
+    endpoint's circuit breaker. Failed attempts are retried with backoff only
+    while the current request deadline leaves time for another attempt.
+    """
+
+    def __init__(
+        self,
+        limit: int = HTTP_POOL_LIMIT,
+        limit_per_host: int = HTTP_POOL_LIMIT_PER_HOST,
+        keepalive_timeout: float = HTTP_KEEPALIVE_TIMEOUT,
+        dns_ttl: int = HTTP_DNS_TTL,
+        timeout: float = HTTP_TIMEOUT,
+        rate_limiter: Optional[RateLimiter] = None,
+        metrics: Optional[HTTPMetrics] = None,
+        attempts: int = HTTP_RETRY_ATTEMPTS,
+        backoff: float = HTTP_RETRY_BACKOFF,
+        min_attempt_time: float = HTTP_RETRY_MIN_TIME
+    ):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_ttl = dns_ttl
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.metrics = metrics or http_metrics
+        self.attempts = attempts
+        self.backoff = backoff
+        self.min_attempt_time = min_attempt_time
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.session: Optional[ClientSession] = None
+        self._start_lock = asyncio.Lock()
+
+    @property
+    def is_running(self) -> bool:
+        return self.session is not None and not self.session.closed
+
+    async def start(self):
+        """Open the connection pool; safe to call more than once"""
+        async with self._start_lock:
+            if self.is_running:
+                return
+
+            connector = TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                use_dns_cache=True,
+                ttl_dns_cache=self.dns_ttl,
+                enable_cleanup_closed=True
+            )
+            self.session = ClientSession(
+                connector=connector,
+                timeout=ClientTimeout(total=self.timeout)
+            )
+
+    async def close(self):
+        """Close the connection pool"""
+        if self.session is not None:
+            await self.session.close()
+        self.session = None
 
     async def __aenter__(self):
-        self.session = ClientSession(connector=self.connector)
-        self.retry_client = RetryClient(
-            client_session=self.session,
-            retry_options=self.retry_options
-        )
+        await self.start()
         return self
 
     async def __aexit__(self, *args):
-        await self.retry_client.close()
-        await self.session.close()
+        await self.close()
+
+    def breaker_for(self, url: str) -> CircuitBreaker:
+        parsed = urlparse(url)
+        endpoint = f"{parsed.hostname}{parsed.path}"
+        if endpoint not in self.breakers:
+            self.breakers[endpoint] = CircuitBreaker(endpoint)
+        return self.breakers[endpoint]
+
+    async def get(
+        self,
+        url,
+        params=None,
+        stream: Optional[Callable[[], Any]] = None,
+        api: Optional[str] = None
+    ):
+        """
+        GET a JSON endpoint
+
+        By default the whole body is decoded with json_loads. With `stream`,
+        a parser factory such as ObjectArrayParser, each attempt feeds the
+        body to a fresh parser as it arrives and returns parser.close().
+        Metrics are recorded under `api`, which defaults to api_name(url).
+        """
+        if not self.is_running:
+            await self.start()
+
+        api = api or api_name(url)
+        breaker = self.breaker_for(url)
+        for attempt in range(1, self.attempts + 1):
+            if not breaker.allow():
+                self.metrics.record_rejected(api, 'circuit_open')
+                raise CircuitOpenError(f"{breaker.name} is unavailable, try again shortly")
+
+            try:
+                return await self._attempt(url, params, breaker, stream, api)
+            except (ClientError, asyncio.TimeoutError) as e:
+                if isinstance(e, ClientResponseError) and e.status not in RETRY_STATUSES:
+                    raise
+                if attempt == self.attempts:
+                    raise
+
+                delay = self.backoff * 2 ** (attempt - 1)
+                if isinstance(e, ClientResponseError) and e.headers:
+                    retry_after = e.headers.get('Retry-After', '')
+                    if retry_after.isdigit():
+                        delay = max(delay, float(retry_after))
+
+                # Don't start a retry that cannot finish before the deadline
+                if remaining_time() - delay < self.min_attempt_time:
+                    raise
+                self.metrics.record_retry(api)
+                await asyncio.sleep(delay)
+
+    async def _attempt(self, url, params, breaker: CircuitBreaker, stream, api: str):
+        """One rate-limited request, bounded by the remaining deadline"""
+        # Attempts that end without an answer from the endpoint release the
+        # breaker, so a half-open probe slot is not held until it expires
+        if remaining_time() <= 0:
+            breaker.release()
+            self.metrics.record_rejected(api, 'deadline_exceeded')
+            raise DeadlineExceeded(f"No time left to request {breaker.name}")
+        waited = time.perf_counter()
+        try:
+            await asyncio.wait_for(self.rate_limiter.acquire(url), _timeout_for(remaining_time()))
+        except asyncio.TimeoutError:
+            breaker.release()
+            self.metrics.record_rejected(api, 'deadline_exceeded')
+            raise DeadlineExceeded(f"Timed out waiting to request {breaker.name}") from None
+        except asyncio.CancelledError:
+            breaker.release()
+            raise
+        self.metrics.record_rate_limit_wait(api, time.perf_counter() - waited)
+
+        timeout = ClientTimeout(total=min(self.timeout, remaining_time()))
+        start = time.perf_counter()
+        received = 0
+        try:
+            async with self.session.get(url, params=params, timeout=timeout) as response:
+                response.raise_for_status()
+                if stream is None:
+                    body = await response.read()
+                    received = len(body)
+                    data = json_loads(body)
+                else:
+                    parser = stream()
+                    async for chunk in response.content.iter_chunked(HTTP_STREAM_CHUNK_SIZE):
+                        received += len(chunk)
+                        parser.feed(chunk)
+                    data = parser.close()
+        except ClientResponseError as e:
+            self.metrics.record_response(api, e.status, time.perf_counter() - start, received)
+            # Only overload and server errors count against the endpoint
+            if e.status in RETRY_STATUSES:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            raise
+        except asyncio.TimeoutError:
+            self.metrics.record_error(api, 'timeout', time.perf_counter() - start)
+            # Cut short by our own deadline rather than a slow endpoint
+            if remaining_time() <= 0:
+                breaker.release()
+                raise DeadlineExceeded(f"Ran out of time requesting {breaker.name}") from None
+            breaker.record_failure()
+            raise
+        except ClientError as e:
+            self.metrics.record_error(api, type(e).__name__, time.perf_counter() - start)
+            breaker.record_failure()
+            raise
+        except ValueError:
+            self.metrics.record_error(api, 'invalid_json', time.perf_counter() - start)
+            breaker.release()
+            raise
+        except asyncio.CancelledError:
+            breaker.release()
+            raise
+
+        self.metrics.record_response(api, response.status, time.perf_counter() - start, received)
+        breaker.record_success()
+        return data
+
+# ----- global http client instance -----
 
-    async def get(self, url, params=None):
-        async with self.retry_client.get(url, params=params) as response:
-            response.raise_for_status()
-            return await response.json()
\ No newline at end of file
+http_metrics = HTTPMetrics()
+http_client = APIClient()
@@ -2,13 +2,46 @@
 
 import sqlite3
 import aiosqlite
-from typing import Optional, List, Dict, Any
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Optional, List, Dict, Any, Iterable, NamedTuple, Tuple, TypeVar
 from datetime import datetime
+import asyncio
 import os
+import time
 
 # ----- database initialization -----
 
 DB_PATH = os.getenv('DATABASE_PATH', './data/moe.db')
+# Read-only connections kept open next to the single writer connection
+DB_POOL_READERS = int(os.getenv('DB_POOL_READERS', '4'))
+# Page cache per connection in KiB, and bytes of the file to memory-map
+DB_CACHE_SIZE_KB = int(os.getenv('DB_CACHE_SIZE_KB', '16384'))
+DB_MMAP_SIZE = int(os.getenv('DB_MMAP_SIZE', str(64 * 1024 * 1024)))
+# Milliseconds a connection waits on a lock held by another process
+DB_BUSY_TIMEOUT = int(os.getenv('DB_BUSY_TIMEOUT', '5000'))
+# Writes waiting for the writer task before callers block, and writes per transaction
+DB_WRITE_QUEUE_SIZE = int(os.getenv('DB_WRITE_QUEUE_SIZE', '1000'))
+DB_WRITE_BATCH_SIZE = int(os.getenv('DB_WRITE_BATCH_SIZE', '200'))
+# Seconds the writer task waits for more writes to join a batch before committing
+DB_WRITE_LINGER = float(os.getenv('DB_WRITE_LINGER', '0'))
+# Seconds a guild's Discord ID -> Steam ID lookups are remembered
+GUILD_MEMBERS_TTL = float(os.getenv('GUILD_MEMBERS_TTL', '60'))
+
+# Bound parameters per statement on SQLite builds older than 3.32
+SQLITE_MAX_VARIABLES = 999
+
+T = TypeVar('T')
+
+# ----- result types -----
+
+class LibraryChanges(NamedTuple):
+    """Appids that a library sync added, updated or removed"""
+    added: List[int]
+    updated: List[int]
+    removed: List[int]
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.updated or self.removed)
 
 # ----- database schema -----
 
@@ -45,7 +78,7 @@ CREATE TABLE IF NOT EXISTS game_events (
     game_appid INTEGER,
     scheduled_time TIMESTAMP NOT NULL,
     created_by INTEGER NOT NULL,
-    participants TEXT,  -- JSON array of discord IDs
+    participants TEXT,  -- JSON array of discord IDs (moved to event_participants by migration 3)
     status TEXT DEFAULT 'upcoming',
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (created_by) REFERENCES users(discord_id)
@@ -82,7 +115,7 @@ CREATE TABLE IF NOT EXISTS user_achievements (
 CREATE TABLE IF NOT EXISTS user_preferences (
     discord_id INTEGER PRIMARY KEY,
     notification_type TEXT DEFAULT 'channel',  -- 'dm' or 'channel'
-    preferred_genres TEXT,  -- JSON array
+    preferred_genres TEXT,  -- JSON array (moved to user_genres by migration 3)
     playtime_threshold INTEGER DEFAULT 2,  -- hours to consider actively playing
     language TEXT DEFAULT 'en-US',
     FOREIGN KEY (discord_id) REFERENCES users(discord_id) ON DELETE CASCADE
@@ -117,9 +150,9 @@ CREATE TABLE IF NOT EXISTS lfg_posts (
 CREATE TABLE IF NOT EXISTS game_metadata (
     appid INTEGER PRIMARY KEY,
     name TEXT NOT NULL,
-    genres TEXT,  -- JSON array
-    categories TEXT,  -- JSON array
-    multiplayer_types TEXT,  -- JSON array: coop, competitive, multiplayer, local_coop
+    genres TEXT,  -- JSON array (moved to game_genres by migration 3)
+    categories TEXT,  -- JSON array (moved to game_categories by migration 3)
+    multiplayer_types TEXT,  -- JSON array (moved to game_multiplayer_types by migration 3)
     release_date TEXT,
     metacritic_score INTEGER,
     steam_rating REAL,
@@ -127,13 +160,144 @@ CREATE TABLE IF NOT EXISTS game_metadata (
 );
 """
 
+# Schema changes for existing databases, applied in order and tracked in PRAGMA user_version
+MIGRATIONS = [
+    (1, """
+-- Secondary indexes, one per access path
+CREATE INDEX IF NOT EXISTS idx_user_games_library ON user_games(steam_id, playtime_forever DESC);
+CREATE INDEX IF NOT EXISTS idx_user_games_appid ON user_games(appid, steam_id);
+CREATE INDEX IF NOT EXISTS idx_game_events_guild_upcoming ON game_events(guild_id, status, scheduled_time);
+CREATE INDEX IF NOT EXISTS idx_price_alerts_active ON price_alerts(discord_id) WHERE notified = 0;
+CREATE INDEX IF NOT EXISTS idx_lfg_posts_guild_active ON lfg_posts(guild_id, status, created_at);
+"""),
+    (2, """
+-- When each library in user_games was last synced from Steam
+CREATE TABLE IF NOT EXISTS library_syncs (
+    steam_id TEXT PRIMARY KEY,
+    synced_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+"""),
+    (3, """
+-- JSON array columns moved into join tables; position keeps each list's order
+CREATE TABLE IF NOT EXISTS event_participants (
+    event_id INTEGER NOT NULL,
+    discord_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (event_id, discord_id),
+    FOREIGN KEY (event_id) REFERENCES game_events(id) ON DELETE CASCADE
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_event_participants_member ON event_participants(discord_id);
+
+CREATE TABLE IF NOT EXISTS game_genres (
+    appid INTEGER NOT NULL,
+    genre TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (appid, genre),
+    FOREIGN KEY (appid) REFERENCES game_metadata(appid) ON DELETE CASCADE
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_game_genres_genre ON game_genres(genre);
+
+CREATE TABLE IF NOT EXISTS game_categories (
+    appid INTEGER NOT NULL,
+    category_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (appid, category_id),
+    FOREIGN KEY (appid) REFERENCES game_metadata(appid) ON DELETE CASCADE
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_game_categories_category ON game_categories(category_id);
+
+CREATE TABLE IF NOT EXISTS game_multiplayer_types (
+    appid INTEGER NOT NULL,
+    multiplayer_type TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (appid, multiplayer_type),
+    FOREIGN KEY (appid) REFERENCES game_metadata(appid) ON DELETE CASCADE
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_game_multiplayer_types_type ON game_multiplayer_types(multiplayer_type);
+
+CREATE TABLE IF NOT EXISTS user_genres (
+    discord_id INTEGER NOT NULL,
+    genre TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (discord_id, genre),
+    FOREIGN KEY (discord_id) REFERENCES user_preferences(discord_id) ON DELETE CASCADE
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_user_genres_genre ON user_genres(genre);
+
+INSERT OR IGNORE INTO event_participants (event_id, discord_id, position)
+    SELECT e.id, item.value, item.key FROM game_events e, json_each(e.participants) item
+    WHERE json_valid(e.participants);
+INSERT OR IGNORE INTO game_genres (appid, genre, position)
+    SELECT gm.appid, item.value, item.key FROM game_metadata gm, json_each(gm.genres) item
+    WHERE json_valid(gm.genres);
+INSERT OR IGNORE INTO game_categories (appid, category_id, position)
+    SELECT gm.appid, item.value, item.key FROM game_metadata gm, json_each(gm.categories) item
+    WHERE json_valid(gm.categories);
+INSERT OR IGNORE INTO game_multiplayer_types (appid, multiplayer_type, position)
+    SELECT gm.appid, item.value, item.key FROM game_metadata gm, json_each(gm.multiplayer_types) item
+    WHERE json_valid(gm.multiplayer_types);
+INSERT OR IGNORE INTO user_genres (discord_id, genre, position)
+    SELECT up.discord_id, item.value, item.key FROM user_preferences up, json_each(up.preferred_genres) item
+    WHERE json_valid(up.preferred_genres);
+
+ALTER TABLE game_events DROP COLUMN participants;
+ALTER TABLE game_metadata DROP COLUMN genres;
+ALTER TABLE game_metadata DROP COLUMN categories;
+ALTER TABLE game_metadata DROP COLUMN multiplayer_types;
+ALTER TABLE user_preferences DROP COLUMN preferred_genres;
+"""),
+]
+
+# game_metadata list fields -> (join table, value column)
+GAME_LIST_TABLES = {
+    'genres': ('game_genres', 'genre'),
+    'categories': ('game_categories', 'category_id'),
+    'multiplayer_types': ('game_multiplayer_types', 'multiplayer_type')
+}
+
+def list_subquery(table: str, column: str, key: str, outer: str) -> str:
+    """SQL selecting one join table's values for an outer row as a JSON array, in stored order"""
+    return (
+        f"(SELECT json_group_array({column}) FROM "
+        f"(SELECT {column} FROM {table} WHERE {key} = {outer} ORDER BY position))"
+    )
+
 # ----- class definitions -----
 
 class Database:
-    """Database manager for Moe bot"""
+    """
+    Database manager for Moe bot
+
+    Connections are opened once and reused: one writer, serialized by a
+    lock, and a small pool of readers. WAL journaling lets the readers run
+    while a write is in progress.
+
+    Mutations are queued for a writer task that applies everything pending
+    in one transaction (one fsync) per batch, each write in its own
+    savepoint so a failing one does not undo the others. Callers wait until
+    their batch commits.
+    """
 
-    def __init__(self, db_path: str = DB_PATH):
+    def __init__(
+        self,
+        db_path: str = DB_PATH,
+        readers: int = DB_POOL_READERS,
+        write_batch_size: int = DB_WRITE_BATCH_SIZE,
+        write_linger: float = DB_WRITE_LINGER
+    ):
         self.db_path = db_path
+        self.pool_readers = readers
+        self.write_batch_size = write_batch_size
+        self.write_linger = write_linger
+        self._writer: Optional[aiosqlite.Connection] = None
+        self._readers: Optional[asyncio.Queue] = None
+        self._connections: List[aiosqlite.Connection] = []
+        self._write_queue: Optional[asyncio.Queue] = None
+        self._write_task: Optional[asyncio.Task] = None
+        self._write_lock = asyncio.Lock()
+        self._open_lock = asyncio.Lock()
+        # guild_id -> (expiry, discord_id -> steam_id or None if unregistered)
+        self._guild_members: Dict[int, Tuple[float, Dict[int, Optional[str]]]] = {}
         self._ensure_data_dir()
 
     def _ensure_data_dir(self):
@@ -141,17 +305,158 @@ class Database:
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
 
     async def initialize(self):
-        """Initialize database with schema"""
-        async with aiosqlite.connect(self.db_path) as db:
+        """Open the connection pool and initialize database with schema"""
+        await self._open()
+        async with self.writer() as db:
             await db.executescript(SCHEMA)
             await db.commit()
+        await self.migrate()
+
+    async def migrate(self) -> int:
+        """Apply pending MIGRATIONS, each in its own transaction; returns the schema version"""
+        async with self.writer() as db:
+            async with db.execute("PRAGMA user_version") as cursor:
+                version = (await cursor.fetchone())[0]
+            for target, script in MIGRATIONS:
+                if target > version:
+                    await db.executescript(f"BEGIN;\n{script}\nPRAGMA user_version = {target};\nCOMMIT;")
+                    version = target
+            return version
+
+    async def close(self):
+        """Commit queued writes, then close every pooled connection"""
+        if self._write_task is not None and not self._write_task.done():
+            await self._write_queue.put(None)
+            await self._write_task
+        self._write_task = None
+        self._write_queue = None
+
+        connections, self._connections = self._connections, []
+        self._writer = None
+        self._readers = None
+        for connection in connections:
+            await connection.close()
+
+    async def _connect(self, *pragmas: str) -> aiosqlite.Connection:
+        connection = await aiosqlite.connect(self.db_path)
+        self._connections.append(connection)
+        connection.row_factory = aiosqlite.Row
+        # executescript finalizes each statement, so no pragma result keeps a lock open
+        await connection.executescript(";".join([
+            f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT}",
+            "PRAGMA synchronous = NORMAL",
+            f"PRAGMA cache_size = {-DB_CACHE_SIZE_KB}",
+            f"PRAGMA mmap_size = {DB_MMAP_SIZE}",
+            "PRAGMA temp_store = MEMORY",
+            *pragmas
+        ]))
+        return connection
+
+    async def _open(self):
+        async with self._open_lock:
+            if self._writer is not None:
+                return
+            try:
+                # WAL is persistent in the file, so it is set before any reader opens it
+                writer = await self._connect("PRAGMA journal_mode = WAL")
+                readers = asyncio.Queue()
+                for _ in range(self.pool_readers):
+                    readers.put_nowait(await self._connect("PRAGMA query_only = ON"))
+            except Exception:
+                await self.close()
+                raise
+            self._readers = readers
+            self._write_queue = asyncio.Queue(DB_WRITE_QUEUE_SIZE)
+            self._writer = writer
+
+    @asynccontextmanager
+    async def reader(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Borrow a read-only pooled connection"""
+        if self._writer is None:
+            await self._open()
+        readers = self._readers
+        connection = await readers.get()
+        try:
+            yield connection
+        finally:
+            readers.put_nowait(connection)
+
+    @asynccontextmanager
+    async def writer(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Hold the writer connection; uncommitted changes are rolled back on error"""
+        if self._writer is None:
+            await self._open()
+        async with self._write_lock:
+            connection = self._writer
+            try:
+                yield connection
+            except BaseException:
+                await connection.rollback()
+                raise
+
+    async def _write(self, operation: Callable[[aiosqlite.Connection], Awaitable[T]]) -> T:
+        """Queue a write for the writer task; returns its result once its batch is committed"""
+        if self._writer is None:
+            await self._open()
+        if self._write_task is None or self._write_task.done():
+            self._write_task = asyncio.create_task(self._run_writes())
+
+        future = asyncio.get_running_loop().create_future()
+        await self._write_queue.put((operation, future))
+        return await future
+
+    async def _run_writes(self):
+        """Writer task: commit queued writes in batches until a None is queued"""
+        queue = self._write_queue
+        while True:
+            batch = [await queue.get()]
+            if self.write_linger:
+                await asyncio.sleep(self.write_linger)
+            while len(batch) < self.write_batch_size and not queue.empty():
+                batch.append(queue.get_nowait())
+
+            stop = None in batch
+            # Writes whose caller gave up (e.g. a cancelled command) are dropped
+            batch = [item for item in batch if item is not None and not item[1].cancelled()]
+            if batch:
+                await self._apply_writes(batch)
+            if stop:
+                return
+
+    async def _apply_writes(self, batch: List[Tuple[Callable, asyncio.Future]]):
+        results = []
+        async with self._write_lock:
+            db = self._writer
+            try:
+                await db.execute("BEGIN")
+                for operation, future in batch:
+                    await db.execute("SAVEPOINT write")
+                    try:
+                        results.append((future, await operation(db), None))
+                    except Exception as e:
+                        await db.execute("ROLLBACK TO write")
+                        results.append((future, None, e))
+                    await db.execute("RELEASE write")
+                await db.commit()
+            except Exception as e:
+                print(f"Error committing database writes: {e}")
+                await db.rollback()
+                results = [(future, None, e) for _, future in batch]
+
+        for future, result, error in results:
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
 
     # ----- User Management -----
 
     async def register_user(self, discord_id: int, steam_id: str, steam_username: str = None) -> bool:
         """Register a new user"""
         try:
-            async with aiosqlite.connect(self.db_path) as db:
+            async def write(db):
                 await db.execute(
                     """INSERT INTO users (discord_id, steam_id, steam_username)
                        VALUES (?, ?, ?)
@@ -161,8 +466,9 @@ class Database:
                            updated_at=CURRENT_TIMESTAMP""",
                     (discord_id, steam_id, steam_username)
                 )
-                await db.commit()
-                return True
+            await self._write(write)
+            self._guild_members.clear()
+            return True
         except Exception as e:
             print(f"Error registering user: {e}")
             return False
@@ -170,18 +476,18 @@ class Database:
     async def unregister_user(self, discord_id: int) -> bool:
         """Unregister a user"""
         try:
-            async with aiosqlite.connect(self.db_path) as db:
+            async def write(db):
                 await db.execute("DELETE FROM users WHERE discord_id = ?", (discord_id,))
-                await db.commit()
-                return True
+            await self._write(write)
+            self._guild_members.clear()
+            return True
         except Exception as e:
             print(f"Error unregistering user: {e}")
             return False
 
     async def get_user(self, discord_id: int) -> Optional[Dict[str, Any]]:
         """Get user by Discord ID"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self.reader() as db:
             async with db.execute(
                 "SELECT * FROM users WHERE discord_id = ?", (discord_id,)
             ) as cursor:
@@ -190,18 +496,49 @@ class Database:
 
     async def get_steam_id(self, discord_id: int) -> Optional[str]:
         """Get Steam ID for a Discord user"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.reader() as db:
             async with db.execute(
                 "SELECT steam_id FROM users WHERE discord_id = ?", (discord_id,)
             ) as cursor:
                 row = await cursor.fetchone()
                 return row[0] if row else None
 
+    async def get_steam_ids(self, discord_ids: Iterable[int], guild_id: Optional[int] = None) -> Dict[int, str]:
+        """
+        Get Steam IDs for many Discord users at once
+
+        Returns registered users only, in input order. With a guild_id, the
+        results are remembered for GUILD_MEMBERS_TTL seconds so repeated
+        commands in the same guild only query members not seen yet.
+        """
+        discord_ids = list(dict.fromkeys(discord_ids))
+        memo: Dict[int, Optional[str]] = {}
+        if guild_id is not None:
+            expires, memo = self._guild_members.get(guild_id, (0, {}))
+            if expires <= time.monotonic():
+                memo = {}
+                self._guild_members[guild_id] = (time.monotonic() + GUILD_MEMBERS_TTL, memo)
+
+        missing = [discord_id for discord_id in discord_ids if discord_id not in memo]
+        found: Dict[int, Optional[str]] = {}
+        if missing:
+            async with self.reader() as db:
+                for start in range(0, len(missing), SQLITE_MAX_VARIABLES):
+                    chunk = missing[start:start + SQLITE_MAX_VARIABLES]
+                    placeholders = ','.join('?' * len(chunk))
+                    async with db.execute(
+                        f"SELECT discord_id, steam_id FROM users WHERE discord_id IN ({placeholders})", chunk
+                    ) as cursor:
+                        found.update(await cursor.fetchall())
+
+        for discord_id in missing:
+            memo[discord_id] = found.get(discord_id)
+        return {discord_id: memo[discord_id] for discord_id in discord_ids if memo[discord_id]}
+
     async def get_users_by_steam_ids(self, steam_ids: List[str]) -> List[Dict[str, Any]]:
         """Get multiple users by Steam IDs"""
         placeholders = ','.join('?' * len(steam_ids))
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self.reader() as db:
             async with db.execute(
                 f"SELECT * FROM users WHERE steam_id IN ({placeholders})", steam_ids
             ) as cursor:
@@ -210,31 +547,126 @@ class Database:
 
     # ----- Game Cache Management -----
 
-    async def cache_user_games(self, steam_id: str, games: List[Dict[str, Any]]):
-        """Cache user's game library"""
-        async with aiosqlite.connect(self.db_path) as db:
-            # Clear old cache
-            await db.execute("DELETE FROM user_games WHERE steam_id = ?", (steam_id,))
+    async def cache_user_games(self, steam_id: str, games: List[Dict[str, Any]]) -> LibraryChanges:
+        """
+        Sync a user's cached game library with a fresh GetOwnedGames response
 
-            # Insert new games
-            for game in games:
-                await db.execute(
-                    """INSERT INTO user_games (steam_id, appid, game_name, playtime_forever, last_played)
-                       VALUES (?, ?, ?, ?, ?)""",
-                    (
-                        steam_id,
-                        game.get('appid'),
-                        game.get('name'),
-                        game.get('playtime_forever', 0),
-                        game.get('rtime_last_played')
-                    )
-                )
-            await db.commit()
+        Only new or changed games are written and only games no longer in
+        the library are deleted, all in one transaction.
+        """
+        incoming = {
+            game.get('appid'): (game.get('name'), game.get('playtime_forever', 0), game.get('rtime_last_played'))
+            for game in games
+        }
+
+        async def write(db):
+            async with db.execute(
+                "SELECT appid, game_name, playtime_forever, last_played FROM user_games WHERE steam_id = ?",
+                (steam_id,)
+            ) as cursor:
+                stored = {row[0]: tuple(row[1:]) for row in await cursor.fetchall()}
+
+            added = [appid for appid in incoming if appid not in stored]
+            updated = [appid for appid in incoming if appid in stored and stored[appid] != incoming[appid]]
+            removed = [appid for appid in stored if appid not in incoming]
+
+            await db.executemany(
+                """INSERT INTO user_games (steam_id, appid, game_name, playtime_forever, last_played)
+                   VALUES (?, ?, ?, ?, ?)
+                   ON CONFLICT(steam_id, appid) DO UPDATE SET
+                       game_name=excluded.game_name,
+                       playtime_forever=excluded.playtime_forever,
+                       last_played=excluded.last_played,
+                       cached_at=CURRENT_TIMESTAMP""",
+                [(steam_id, appid, *incoming[appid]) for appid in added + updated]
+            )
+            await db.executemany(
+                "DELETE FROM user_games WHERE steam_id = ? AND appid = ?",
+                [(steam_id, appid) for appid in removed]
+            )
+            await db.execute(
+                """INSERT INTO library_syncs (steam_id) VALUES (?)
+                   ON CONFLICT(steam_id) DO UPDATE SET synced_at=CURRENT_TIMESTAMP""",
+                (steam_id,)
+            )
+            return LibraryChanges(added, updated, removed)
+        return await self._write(write)
+
+    async def get_stale_libraries(self, steam_ids: List[str], max_age: float) -> List[str]:
+        """Steam IDs whose cached library was never synced or is older than max_age seconds"""
+        steam_ids = list(dict.fromkeys(steam_ids))
+        fresh = set()
+        async with self.reader() as db:
+            for start in range(0, len(steam_ids), SQLITE_MAX_VARIABLES - 1):
+                chunk = steam_ids[start:start + SQLITE_MAX_VARIABLES - 1]
+                placeholders = ','.join('?' * len(chunk))
+                async with db.execute(
+                    f"""SELECT steam_id FROM library_syncs
+                        WHERE steam_id IN ({placeholders}) AND synced_at >= datetime('now', ?)""",
+                    [*chunk, f"-{max_age} seconds"]
+                ) as cursor:
+                    fresh.update(row[0] for row in await cursor.fetchall())
+        return [steam_id for steam_id in steam_ids if steam_id not in fresh]
+
+    async def get_synced_libraries(self, steam_ids: List[str]) -> List[str]:
+        """Steam IDs whose library has been synced at least once"""
+        steam_ids = list(dict.fromkeys(steam_ids))
+        synced = set()
+        async with self.reader() as db:
+            for start in range(0, len(steam_ids), SQLITE_MAX_VARIABLES):
+                chunk = steam_ids[start:start + SQLITE_MAX_VARIABLES]
+                placeholders = ','.join('?' * len(chunk))
+                async with db.execute(
+                    f"SELECT steam_id FROM library_syncs WHERE steam_id IN ({placeholders})",
+                    chunk
+                ) as cursor:
+                    synced.update(row[0] for row in await cursor.fetchall())
+        return [steam_id for steam_id in steam_ids if steam_id in synced]
+
+    async def get_shared_games(self, steam_ids: List[str], min_owners: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Games in the cached libraries of at least min_owners of the Steam IDs
+
+        min_owners defaults to all of them. Each game has appid, name, owners
+        and playtimes (minutes per owning Steam ID); games with more owners
+        and more total playtime come first.
+        """
+        import json
+        steam_ids = list(dict.fromkeys(steam_ids))
+        if not steam_ids:
+            return []
+
+        placeholders = ','.join('?' * len(steam_ids))
+        async with self.reader() as db:
+            async with db.execute(
+                f"""SELECT appid, MAX(game_name) AS name, COUNT(*) AS owners,
+                           json_group_object(steam_id, playtime_forever) AS playtimes
+                    FROM user_games
+                    WHERE steam_id IN ({placeholders})
+                    GROUP BY appid
+                    HAVING COUNT(*) >= ?
+                    ORDER BY owners DESC, SUM(playtime_forever) DESC""",
+                [*steam_ids, min_owners or len(steam_ids)]
+            ) as cursor:
+                rows = await cursor.fetchall()
+                return [
+                    {**dict(row), 'playtimes': json.loads(row['playtimes'])}
+                    for row in rows
+                ]
+
+    async def get_appids_missing_metadata(self) -> List[int]:
+        """Appids in any cached library that have no game_metadata row yet"""
+        async with self.reader() as db:
+            async with db.execute(
+                """SELECT DISTINCT appid FROM user_games ug
+                   WHERE NOT EXISTS (SELECT 1 FROM game_metadata gm WHERE gm.appid = ug.appid)"""
+            ) as cursor:
+                rows = await cursor.fetchall()
+                return [row[0] for row in rows]
 
     async def get_user_games(self, steam_id: str) -> List[Dict[str, Any]]:
         """Get cached user games"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self.reader() as db:
             async with db.execute(
                 "SELECT * FROM user_games WHERE steam_id = ? ORDER BY playtime_forever DESC",
                 (steam_id,)
@@ -254,45 +686,61 @@ class Database:
         participants: List[int] = None
     ) -> int:
         """Create a new game event"""
-        import json
-        async with aiosqlite.connect(self.db_path) as db:
+        async def write(db):
             cursor = await db.execute(
                 """INSERT INTO game_events
-                   (guild_id, game_name, game_appid, scheduled_time, created_by, participants)
-                   VALUES (?, ?, ?, ?, ?, ?)""",
+                   (guild_id, game_name, game_appid, scheduled_time, created_by)
+                   VALUES (?, ?, ?, ?, ?)""",
                 (
                     guild_id,
                     game_name,
                     game_appid,
                     scheduled_time.isoformat(),
-                    created_by,
-                    json.dumps(participants or [])
+                    created_by
                 )
             )
-            await db.commit()
-            return cursor.lastrowid
-
-    async def get_upcoming_events(self, guild_id: int) -> List[Dict[str, Any]]:
-        """Get upcoming events for a guild"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+            event_id = cursor.lastrowid
+            await db.executemany(
+                "INSERT OR IGNORE INTO event_participants (event_id, discord_id, position) VALUES (?, ?, ?)",
+                [(event_id, discord_id, position) for position, discord_id in enumerate(participants or [])]
+            )
+            return event_id
+        return await self._write(write)
+
+    async def get_upcoming_events(self, guild_id: int, discord_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Get upcoming events for a guild
+
+        With a discord_id, only events that user created or takes part in.
+        participants is a JSON array of Discord IDs.
+        """
+        member_filter = ""
+        values = [guild_id]
+        if discord_id is not None:
+            member_filter = """AND (e.created_by = ? OR EXISTS (
+                SELECT 1 FROM event_participants ep WHERE ep.event_id = e.id AND ep.discord_id = ?))"""
+            values += [discord_id, discord_id]
+
+        async with self.reader() as db:
             async with db.execute(
-                """SELECT * FROM game_events
-                   WHERE guild_id = ? AND status = 'upcoming' AND scheduled_time > datetime('now')
-                   ORDER BY scheduled_time ASC""",
-                (guild_id,)
+                f"""SELECT e.*, {list_subquery('event_participants', 'discord_id', 'event_id', 'e.id')} AS participants
+                    FROM game_events e
+                    WHERE e.guild_id = ? AND e.status = 'upcoming' AND e.scheduled_time > datetime('now')
+                    {member_filter}
+                    ORDER BY e.scheduled_time ASC""",
+                values
             ) as cursor:
                 rows = await cursor.fetchall()
                 return [dict(row) for row in rows]
 
     async def update_event_status(self, event_id: int, status: str):
         """Update event status"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async def write(db):
             await db.execute(
                 "UPDATE game_events SET status = ? WHERE id = ?",
                 (status, event_id)
             )
-            await db.commit()
+        await self._write(write)
 
     # ----- Price Alerts Management -----
 
@@ -305,20 +753,19 @@ class Database:
         current_price: float = None
     ) -> int:
         """Add a price alert"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async def write(db):
             cursor = await db.execute(
                 """INSERT INTO price_alerts
                    (discord_id, appid, game_name, target_price, current_price)
                    VALUES (?, ?, ?, ?, ?)""",
                 (discord_id, appid, game_name, target_price, current_price)
             )
-            await db.commit()
             return cursor.lastrowid
+        return await self._write(write)
 
     async def get_user_alerts(self, discord_id: int) -> List[Dict[str, Any]]:
         """Get user's price alerts"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self.reader() as db:
             async with db.execute(
                 "SELECT * FROM price_alerts WHERE discord_id = ? AND notified = 0",
                 (discord_id,)
@@ -328,8 +775,7 @@ class Database:
 
     async def get_all_active_alerts(self) -> List[Dict[str, Any]]:
         """Get all active price alerts"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self.reader() as db:
             async with db.execute(
                 "SELECT * FROM price_alerts WHERE notified = 0"
             ) as cursor:
@@ -338,12 +784,12 @@ class Database:
 
     async def mark_alert_notified(self, alert_id: int):
         """Mark price alert as notified"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async def write(db):
             await db.execute(
                 "UPDATE price_alerts SET notified = 1 WHERE id = ?",
                 (alert_id,)
             )
-            await db.commit()
+        await self._write(write)
 
     # ----- LFG Posts Management -----
 
@@ -358,7 +804,7 @@ class Database:
         scheduled_time: datetime = None
     ) -> int:
         """Create a Looking For Group post"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async def write(db):
             cursor = await db.execute(
                 """INSERT INTO lfg_posts
                    (guild_id, discord_id, game_name, description, players_needed, appid, scheduled_time)
@@ -373,13 +819,12 @@ class Database:
                     scheduled_time.isoformat() if scheduled_time else None
                 )
             )
-            await db.commit()
             return cursor.lastrowid
+        return await self._write(write)
 
     async def get_active_lfg_posts(self, guild_id: int) -> List[Dict[str, Any]]:
         """Get active LFG posts for a guild"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self.reader() as db:
             async with db.execute(
                 """SELECT * FROM lfg_posts
                    WHERE guild_id = ? AND status = 'active'
@@ -391,62 +836,89 @@ class Database:
 
     async def close_lfg_post(self, post_id: int):
         """Close an LFG post"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async def write(db):
             await db.execute(
                 "UPDATE lfg_posts SET status = 'closed' WHERE id = ?",
                 (post_id,)
             )
-            await db.commit()
+        await self._write(write)
 
     # ----- Game Metadata Cache -----
 
     async def cache_game_metadata(self, appid: int, metadata: Dict[str, Any]):
         """Cache game metadata"""
-        import json
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute(
+        await self.cache_game_metadata_many({appid: metadata})
+
+    async def cache_game_metadata_many(self, metadata: Dict[int, Dict[str, Any]]):
+        """Cache metadata for many games in one transaction"""
+        async def write(db):
+            await db.executemany(
                 """INSERT INTO game_metadata
-                   (appid, name, genres, categories, multiplayer_types, release_date, metacritic_score, steam_rating)
-                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                   (appid, name, release_date, metacritic_score, steam_rating)
+                   VALUES (?, ?, ?, ?, ?)
                    ON CONFLICT(appid) DO UPDATE SET
                        name=excluded.name,
-                       genres=excluded.genres,
-                       categories=excluded.categories,
-                       multiplayer_types=excluded.multiplayer_types,
                        release_date=excluded.release_date,
                        metacritic_score=excluded.metacritic_score,
                        steam_rating=excluded.steam_rating,
                        cached_at=CURRENT_TIMESTAMP""",
-                (
-                    appid,
-                    metadata.get('name'),
-                    json.dumps(metadata.get('genres', [])),
-                    json.dumps(metadata.get('categories', [])),
-                    json.dumps(metadata.get('multiplayer_types', [])),
-                    metadata.get('release_date'),
-                    metadata.get('metacritic_score'),
-                    metadata.get('steam_rating')
-                )
+                [
+                    (
+                        appid,
+                        game.get('name'),
+                        game.get('release_date'),
+                        game.get('metacritic_score'),
+                        game.get('steam_rating')
+                    )
+                    for appid, game in metadata.items()
+                ]
             )
-            await db.commit()
+            for field, (table, column) in GAME_LIST_TABLES.items():
+                await db.executemany(f"DELETE FROM {table} WHERE appid = ?", [(appid,) for appid in metadata])
+                await db.executemany(
+                    f"INSERT OR IGNORE INTO {table} (appid, {column}, position) VALUES (?, ?, ?)",
+                    [
+                        (appid, value, position)
+                        for appid, game in metadata.items()
+                        for position, value in enumerate(game.get(field, []))
+                    ]
+                )
+        await self._write(write)
 
     async def get_game_metadata(self, appid: int) -> Optional[Dict[str, Any]]:
         """Get cached game metadata"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        lists = ', '.join(
+            f"{list_subquery(table, column, 'appid', 'gm.appid')} AS {field}"
+            for field, (table, column) in GAME_LIST_TABLES.items()
+        )
+        async with self.reader() as db:
             async with db.execute(
-                "SELECT * FROM game_metadata WHERE appid = ?", (appid,)
+                f"SELECT gm.*, {lists} FROM game_metadata gm WHERE gm.appid = ?", (appid,)
             ) as cursor:
                 row = await cursor.fetchone()
                 if row:
                     import json
                     data = dict(row)
-                    data['genres'] = json.loads(data.get('genres', '[]'))
-                    data['categories'] = json.loads(data.get('categories', '[]'))
-                    data['multiplayer_types'] = json.loads(data.get('multiplayer_types', '[]'))
+                    for field in GAME_LIST_TABLES:
+                        data[field] = json.loads(data[field])
                     return data
                 return None
 
+    async def get_game_categories(self) -> Dict[int, List[int]]:
+        """Steam category IDs of every game with cached metadata"""
+        categories: Dict[int, List[int]] = {}
+        async with self.reader() as db:
+            async with db.execute(
+                """SELECT gm.appid, gc.category_id FROM game_metadata gm
+                   LEFT JOIN game_categories gc ON gc.appid = gm.appid
+                   ORDER BY gm.appid, gc.position"""
+            ) as cursor:
+                async for appid, category_id in cursor:
+                    ids = categories.setdefault(appid, [])
+                    if category_id is not None:
+                        ids.append(category_id)
+        return categories
+
     # ----- User Preferences -----
 
     async def set_user_preferences(
@@ -458,45 +930,55 @@ class Database:
         language: str = None
     ):
         """Set user preferences"""
-        import json
-        async with aiosqlite.connect(self.db_path) as db:
-            updates = []
-            values = []
+        updates = {}
 
-            if notification_type:
-                updates.append("notification_type = ?")
-                values.append(notification_type)
-            if preferred_genres is not None:
-                updates.append("preferred_genres = ?")
-                values.append(json.dumps(preferred_genres))
-            if playtime_threshold is not None:
-                updates.append("playtime_threshold = ?")
-                values.append(playtime_threshold)
-            if language:
-                updates.append("language = ?")
-                values.append(language)
+        if notification_type:
+            updates['notification_type'] = notification_type
+        if playtime_threshold is not None:
+            updates['playtime_threshold'] = playtime_threshold
+        if language:
+            updates['language'] = language
+
+        if not updates and preferred_genres is None:
+            return
 
+        async def write(db):
             if updates:
-                values.append(discord_id)
+                columns = ', '.join(['discord_id', *updates])
+                placeholders = ', '.join('?' * (len(updates) + 1))
+                assignments = ', '.join(f"{column}=excluded.{column}" for column in updates)
                 await db.execute(
-                    f"""INSERT INTO user_preferences (discord_id) VALUES (?)
-                        ON CONFLICT(discord_id) DO UPDATE SET {', '.join(updates)}""",
-                    values
+                    f"""INSERT INTO user_preferences ({columns}) VALUES ({placeholders})
+                        ON CONFLICT(discord_id) DO UPDATE SET {assignments}""",
+                    [discord_id, *updates.values()]
+                )
+            else:
+                await db.execute(
+                    "INSERT INTO user_preferences (discord_id) VALUES (?) ON CONFLICT(discord_id) DO NOTHING",
+                    (discord_id,)
                 )
-                await db.commit()
+
+            if preferred_genres is not None:
+                await db.execute("DELETE FROM user_genres WHERE discord_id = ?", (discord_id,))
+                await db.executemany(
+                    "INSERT OR IGNORE INTO user_genres (discord_id, genre, position) VALUES (?, ?, ?)",
+                    [(discord_id, genre, position) for position, genre in enumerate(preferred_genres)]
+                )
+        await self._write(write)
 
     async def get_user_preferences(self, discord_id: int) -> Optional[Dict[str, Any]]:
         """Get user preferences"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self.reader() as db:
             async with db.execute(
-                "SELECT * FROM user_preferences WHERE discord_id = ?", (discord_id,)
+                f"""SELECT up.*, {list_subquery('user_genres', 'genre', 'discord_id', 'up.discord_id')} AS preferred_genres
+                    FROM user_preferences up WHERE up.discord_id = ?""",
+                (discord_id,)
             ) as cursor:
                 row = await cursor.fetchone()
                 if row:
                     import json
                     data = dict(row)
-                    data['preferred_genres'] = json.loads(data.get('preferred_genres', '[]'))
+                    data['preferred_genres'] = json.loads(data['preferred_genres'])
                     return data
                 return None
 
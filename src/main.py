@@ -7,15 +7,17 @@ import asyncio
 from discord import app_commands
 from discord.ext import commands
 from datetime import datetime, timedelta
-from typing import List, Optional
+from typing import List, Optional, Tuple
 import json
 
 from src.api import SteamAPI
-from src.cache import cache
+from src.cache import backend_info, cache_metrics, start_invalidation_listener, stop_invalidation_listener
+from src.client import http_client, http_metrics, set_request_deadline
 from src.database import db
 from src.ai_recommendations import ai_engine
 from src.price_tracker import price_tracker
 from src.matchmaking import matchmaking
+from src.metadata import METADATA_INGEST_ENABLED, capability_index, metadata_ingestor
 
 # ----- environment initialization -----
 
@@ -24,43 +26,121 @@ load_dotenv()
 intents = discord.Intents.default()
 intents.message_content = True
 intents.members = True
-bot = commands.Bot(command_prefix='!', intents=intents)
 
-# ----- helper functions -----
+# Seconds a command may spend on upstream requests, counted from the
+# interaction; must stay well inside Discord's 15-minute follow-up window
+INTERACTION_TIME_BUDGET = float(os.getenv('INTERACTION_TIME_BUDGET', '30'))
+# Seconds a library synced into the database is used before refetching it from Steam
+LIBRARY_MAX_AGE = float(os.getenv('LIBRARY_MAX_AGE', '3600'))
+
+class MoeTree(app_commands.CommandTree):
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        """Give the command's requests the interaction's remaining time budget"""
+        elapsed = (discord.utils.utcnow() - interaction.created_at).total_seconds()
+        set_request_deadline(INTERACTION_TIME_BUDGET - elapsed)
+        return True
+
+class MoeBot(commands.Bot):
+    async def close(self):
+        """Release process-wide resources on shutdown"""
+        await stop_invalidation_listener()
+        await metadata_ingestor.stop()
+        await http_client.close()
+        await db.close()
+        await super().close()
+
+bot = MoeBot(command_prefix='!', intents=intents, tree_cls=MoeTree)
+
+# Game filters for comparison commands, backed by the capability index
+GAME_FILTER_CHOICES = [
+    app_commands.Choice(name="Multiplayer", value="multiplayer"),
+    app_commands.Choice(name="Co-op", value="coop"),
+    app_commands.Choice(name="Online co-op", value="online_coop"),
+    app_commands.Choice(name="Local co-op", value="local_coop"),
+    app_commands.Choice(name="PvP", value="competitive"),
+    app_commands.Choice(name="LAN", value="lan"),
+    app_commands.Choice(name="All shared games", value="any")
+]
 
-async def get_steam_id_from_user(discord_id: int) -> Optional[str]:
-    """Get Steam ID for a Discord user from database"""
-    return await db.get_steam_id(discord_id)
+# ----- helper functions -----
 
-async def find_common_games(steam_ids: List[str]) -> List[dict]:
-    """Find games common to all provided Steam IDs"""
+async def get_steam_ids_from_users(users: List[discord.Member]) -> Tuple[List[str], List[discord.Member]]:
+    """Get Steam IDs for several Discord users in one lookup; returns (steam_ids, unregistered users)"""
+    steam_ids = await db.get_steam_ids([user.id for user in users], users[0].guild.id)
+    unregistered = [user for user in users if user.id not in steam_ids]
+    return [steam_ids[user.id] for user in users if user.id in steam_ids], unregistered
+
+async def find_common_games(
+    steam_ids: List[str],
+    filters: Optional[List[str]] = None,
+    min_owners: Optional[int] = None
+) -> List[dict]:
+    """
+    Find games common to all provided Steam IDs, or to at least min_owners of them
+
+    Libraries are intersected in the database; any that are missing or
+    older than LIBRARY_MAX_AGE are synced from Steam first. If Steam fails
+    to answer for a user synced before, their stored library is used;
+    for a user never synced the error is raised. With filters
+    (multiplayer type names such as 'multiplayer' or 'lan'), only games
+    matching all of them are kept. Games not classified yet are kept too
+    and queued for background metadata lookup.
+    """
     if not steam_ids:
         return []
 
-    # Get games for all users in parallel
-    games_lists = await asyncio.gather(
-        *[SteamAPI.get_owned_games(sid) for sid in steam_ids]
-    )
-
-    # Find intersection
-    if not games_lists:
-        return []
-
-    # Start with first user's games
-    common_appids = {game['appid'] for game in games_lists[0]}
-
-    # Intersect with other users' games
-    for games in games_lists[1:]:
-        user_appids = {game['appid'] for game in games}
-        common_appids &= user_appids
-
-    # Return full game data for common games
-    common_games = [
-        game for game in games_lists[0]
-        if game['appid'] in common_appids
-    ]
-
-    return sorted(common_games, key=lambda x: x.get('playtime_forever', 0), reverse=True)
+    # Sync stale libraries from Steam itself, so a sync is only marked fresh when it is
+    stale = await db.get_stale_libraries(steam_ids, LIBRARY_MAX_AGE)
+    if stale:
+        libraries = await SteamAPI.refresh_owned_games_many(stale, return_exceptions=True)
+        failed = {
+            steam_id: error for steam_id, error in libraries.items()
+            if isinstance(error, BaseException)
+        }
+
+        # Submitted together so the writer commits them in one batch
+        synced = await asyncio.gather(
+            *[
+                db.cache_user_games(steam_id, games)
+                for steam_id, games in libraries.items() if steam_id not in failed
+            ]
+        )
+        for changes in synced:
+            metadata_ingestor.enqueue(changes.added)
+
+        # Without stored rows a failed user would just look like they own nothing
+        if failed:
+            synced_before = set(await db.get_synced_libraries(list(failed)))
+            for steam_id, error in failed.items():
+                if steam_id not in synced_before:
+                    raise error
+                print(f"Error syncing library for {steam_id}, using stored games: {error}")
+
+    # Playtime shown is the first user's, as with a single library
+    common_games = await db.get_shared_games(steam_ids, min_owners)
+    for game in common_games:
+        game['playtime_forever'] = game['playtimes'].get(steam_ids[0], 0)
+
+    if filters:
+        matches, unknown = capability_index.filter(common_games, filters)
+        if unknown:
+            metadata_ingestor.enqueue(unknown)
+            unknown_appids = set(unknown)
+            matches += [game for game in common_games if game['appid'] in unknown_appids]
+        common_games = matches
+
+    return sorted(common_games, key=lambda x: (x['owners'], x['playtime_forever']), reverse=True)
+
+def game_filters(mode: Optional[app_commands.Choice[str]]) -> List[str]:
+    """Capability filters for a comparison mode choice, multiplayer by default"""
+    value = mode.value if mode else "multiplayer"
+    return [] if value == "any" else [value]
+
+def filter_label(mode: Optional[app_commands.Choice[str]]) -> str:
+    """Adjective for a comparison mode choice, with a trailing space"""
+    if mode is None:
+        return "multiplayer "
+    return "" if mode.value == "any" else f"{mode.name.lower()} "
 
 def format_game_list(games: List[dict], limit: int = 25) -> str:
     """Format game list for Discord embed"""
@@ -78,6 +158,14 @@ def format_game_list(games: List[dict], limit: int = 25) -> str:
 
     return "\n".join(lines)
 
+def format_bytes(size: float) -> str:
+    """Format a byte count for Discord embeds"""
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f}{unit}"
+        size /= 1024
+    return f"{size:.1f}GB"
+
 async def handle_error(interaction: discord.Interaction, error: Exception):
     """Handle errors gracefully"""
     error_msg = f"❌ Error: {str(error)}"
@@ -100,6 +188,20 @@ async def on_ready():
     await db.initialize()
     print("Database initialized")
 
+    # Load game categories for multiplayer filtering
+    await capability_index.load()
+    print(f"Indexed categories for {len(capability_index)} games")
+
+    # Keep the in-process cache tier coherent with other replicas
+    start_invalidation_listener()
+
+    # Open the shared HTTP connection pool
+    await http_client.start()
+
+    # Fill game_metadata for cached libraries in the background
+    if METADATA_INGEST_ENABLED:
+        metadata_ingestor.start()
+
     # Sync commands
     try:
         GUILD_ID = os.getenv('DISCORD_GUILD_ID')
@@ -155,7 +257,8 @@ async def register(interaction: discord.Interaction, steam_id: str):
         if success:
             # Cache their games
             games = await SteamAPI.get_owned_games(steam_id)
-            await db.cache_user_games(steam_id, games)
+            changes = await db.cache_user_games(steam_id, games)
+            metadata_ingestor.enqueue(changes.added)
 
             embed = discord.Embed(
                 title="✅ Registration Successful",
@@ -265,43 +368,44 @@ async def profile(interaction: discord.Interaction, user: Optional[discord.Membe
 # ----- game comparison commands -----
 
 @bot.tree.command(name="compare", description="Find shared multiplayer games between users")
-@app_commands.describe(user1="First user", user2="Second user")
-async def compare(interaction: discord.Interaction, user1: discord.Member, user2: discord.Member):
+@app_commands.describe(user1="First user", user2="Second user", mode="Which shared games to show (default: multiplayer)")
+@app_commands.choices(mode=GAME_FILTER_CHOICES)
+async def compare(
+    interaction: discord.Interaction,
+    user1: discord.Member,
+    user2: discord.Member,
+    mode: Optional[app_commands.Choice[str]] = None
+):
     """Compare games between two users"""
     await interaction.response.defer()
 
     try:
         # Get Steam IDs
-        steam_id1 = await get_steam_id_from_user(user1.id)
-        steam_id2 = await get_steam_id_from_user(user2.id)
+        steam_ids, unregistered = await get_steam_ids_from_users([user1, user2])
 
-        if not steam_id1:
+        if unregistered:
             await interaction.followup.send(
-                f"❌ {user1.mention} is not registered. Use `/register` first.",
+                f"❌ {unregistered[0].mention} is not registered. Use `/register` first.",
                 ephemeral=True
             )
             return
 
-        if not steam_id2:
-            await interaction.followup.send(
-                f"❌ {user2.mention} is not registered. Use `/register` first.",
-                ephemeral=True
-            )
-            return
+        steam_id1, steam_id2 = steam_ids
 
         # Find common games
-        common_games = await find_common_games([steam_id1, steam_id2])
+        filters = game_filters(mode)
+        common_games = await find_common_games([steam_id1, steam_id2], filters)
 
         if not common_games:
             await interaction.followup.send(
-                f"❌ No shared games found between {user1.mention} and {user2.mention}."
+                f"❌ No shared {filter_label(mode)}games found between {user1.mention} and {user2.mention}."
             )
             return
 
         # Create embed
         embed = discord.Embed(
             title=f"🎮 Shared Games: {user1.display_name} & {user2.display_name}",
-            description=f"Found **{len(common_games)}** shared games!",
+            description=f"Found **{len(common_games)}** shared {filter_label(mode)}games!",
             color=discord.Color.green()
         )
 
@@ -322,15 +426,20 @@ async def compare(interaction: discord.Interaction, user1: discord.Member, user2
     user2="User 2",
     user3="User 3 (optional)",
     user4="User 4 (optional)",
-    user5="User 5 (optional)"
+    user5="User 5 (optional)",
+    mode="Which shared games to show (default: multiplayer)",
+    min_owners="Also show games only this many of the group own (default: everyone)"
 )
+@app_commands.choices(mode=GAME_FILTER_CHOICES)
 async def compare_group(
     interaction: discord.Interaction,
     user1: discord.Member,
     user2: discord.Member,
     user3: Optional[discord.Member] = None,
     user4: Optional[discord.Member] = None,
-    user5: Optional[discord.Member] = None
+    user5: Optional[discord.Member] = None,
+    mode: Optional[app_commands.Choice[str]] = None,
+    min_owners: Optional[app_commands.Range[int, 1, 5]] = None
 ):
     """Compare games for a group of users"""
     await interaction.response.defer()
@@ -339,23 +448,22 @@ async def compare_group(
         users = [u for u in [user1, user2, user3, user4, user5] if u]
 
         # Get Steam IDs
-        steam_ids = []
-        for user in users:
-            steam_id = await get_steam_id_from_user(user.id)
-            if not steam_id:
-                await interaction.followup.send(
-                    f"❌ {user.mention} is not registered. Use `/register` first.",
-                    ephemeral=True
-                )
-                return
-            steam_ids.append(steam_id)
+        steam_ids, unregistered = await get_steam_ids_from_users(users)
+        if unregistered:
+            await interaction.followup.send(
+                f"❌ {unregistered[0].mention} is not registered. Use `/register` first.",
+                ephemeral=True
+            )
+            return
 
         # Find common games
-        common_games = await find_common_games(steam_ids)
+        if min_owners is not None and min_owners >= len(steam_ids):
+            min_owners = None
+        common_games = await find_common_games(steam_ids, game_filters(mode), min_owners)
 
         if not common_games:
             await interaction.followup.send(
-                f"❌ No shared games found among the group."
+                f"❌ No shared {filter_label(mode)}games found among the group."
             )
             return
 
@@ -363,7 +471,10 @@ async def compare_group(
         user_names = ", ".join([u.display_name for u in users])
         embed = discord.Embed(
             title=f"🎮 Group Games ({len(users)} players)",
-            description=f"Found **{len(common_games)}** games everyone owns!",
+            description=(
+                f"Found **{len(common_games)}** {filter_label(mode)}games "
+                + (f"at least {min_owners} of you own!" if min_owners else "everyone owns!")
+            ),
             color=discord.Color.gold()
         )
 
@@ -396,16 +507,13 @@ async def recommend(
         users = [user1, user2] if user2 else [user1]
 
         # Get Steam IDs
-        steam_ids = []
-        for user in users:
-            steam_id = await get_steam_id_from_user(user.id)
-            if not steam_id:
-                await interaction.followup.send(
-                    f"❌ {user.mention} is not registered.",
-                    ephemeral=True
-                )
-                return
-            steam_ids.append(steam_id)
+        steam_ids, unregistered = await get_steam_ids_from_users(users)
+        if unregistered:
+            await interaction.followup.send(
+                f"❌ {unregistered[0].mention} is not registered.",
+                ephemeral=True
+            )
+            return
 
         # Get shared games
         if len(steam_ids) > 1:
@@ -562,7 +670,13 @@ async def deals(interaction: discord.Interaction):
     await interaction.response.defer()
 
     try:
-        current_deals = await price_tracker.get_current_deals(limit=10)
+        try:
+            current_deals = await price_tracker.get_current_deals(limit=10)
+        except Exception as e:
+            # Not the same as an empty list: the deals service did not answer
+            print(f"Error fetching deals: {e}")
+            await interaction.followup.send("❌ Couldn't reach the deals service right now, try again later.")
+            return
 
         if not current_deals:
             await interaction.followup.send("No deals found at the moment.")
@@ -606,8 +720,12 @@ async def watch(interaction: discord.Interaction, game_name: str, target_price:
             )
             return
 
-        # Get current price
-        current_price_data = await price_tracker.get_game_price(game_name)
+        # Get current price; the alert is saved even when the price service is down
+        try:
+            current_price_data = await price_tracker.get_game_price(game_name)
+        except Exception as e:
+            print(f"Error fetching price for {game_name}: {e}")
+            current_price_data = None
         current_price = None
 
         if current_price_data:
@@ -713,7 +831,8 @@ async def match_me(interaction: discord.Interaction):
         matches = await matchmaking.find_best_matches(
             interaction.user.id,
             guild_members,
-            limit=5
+            limit=5,
+            guild_id=interaction.guild.id
         )
 
         if not matches:
@@ -754,8 +873,9 @@ async def compatibility(interaction: discord.Interaction, user: discord.Member):
 
     try:
         # Check if both users are registered
-        user1_steam = await db.get_steam_id(interaction.user.id)
-        user2_steam = await db.get_steam_id(user.id)
+        steam_ids = await db.get_steam_ids([interaction.user.id, user.id], interaction.guild_id)
+        user1_steam = steam_ids.get(interaction.user.id)
+        user2_steam = steam_ids.get(user.id)
 
         if not user1_steam:
             await interaction.followup.send(
@@ -803,7 +923,7 @@ async def find_players(interaction: discord.Interaction, game_name: str):
         guild_members = [m.id for m in interaction.guild.members if not m.bot]
 
         # Find players
-        results = await matchmaking.find_players_for_game(game_name, guild_members)
+        results = await matchmaking.find_players_for_game(game_name, guild_members, interaction.guild.id)
 
         if not results:
             await interaction.followup.send(
@@ -918,15 +1038,88 @@ async def lfg_board(interaction: discord.Interaction):
 
 # ----- utility commands -----
 
-@bot.tree.command(name="cache", description="Show Redis cache statistics")
+@bot.tree.command(name="cache", description="Show cache hit rates, latency and value sizes")
 async def cache_stats(interaction: discord.Interaction):
     """Show cache stats"""
     try:
-        stats = await cache.raw("info", "memory")
-        await interaction.response.send_message(
-            f"**Cache Stats**\n```{stats.decode()[:1000]}```",
-            ephemeral=True
+        info = await backend_info()
+        snapshot = cache_metrics.snapshot()
+
+        description = f"Backend: **{info['backend']}** · {info['keys']} keys"
+        if info.get('used_memory'):
+            description += f" · {info['used_memory']} used"
+        if info['local_keys'] is not None:
+            description += f"\nLocal tier: {info['local_keys']} keys"
+
+        embed = discord.Embed(
+            title="🗄️ Cache Statistics",
+            description=description,
+            color=discord.Color.blue()
         )
+
+        for family, stats in list(snapshot.items())[:24]:
+            get_latency = stats['get_latency_ms']
+            set_latency = stats['set_latency_ms']
+            size = stats['value_size_bytes']
+            embed.add_field(
+                name=family,
+                value=(
+                    f"🎯 {stats['hit_ratio'] * 100:.1f}% hit rate "
+                    f"({stats['hits']} hit · {stats['stale_hits']} stale · {stats['misses']} miss"
+                    f" · {stats['local_hits']} local)\n"
+                    f"⏱️ get p50 {get_latency['p50']:.0f}ms · p95 {get_latency['p95']:.0f}ms"
+                    f" · set p95 {set_latency['p95']:.0f}ms\n"
+                    f"📦 {stats['sets']} writes · avg {format_bytes(size['mean'])}"
+                    f" · p95 {format_bytes(size['p95'])}"
+                ),
+                inline=False
+            )
+
+        if not snapshot:
+            embed.add_field(name="No activity", value="No cache lookups recorded yet.")
+
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+    except Exception as e:
+        await handle_error(interaction, e)
+
+@bot.tree.command(name="api_stats", description="Show outbound API request counts, latency and errors")
+async def api_stats(interaction: discord.Interaction):
+    """Show outbound API stats"""
+    try:
+        snapshot = http_metrics.snapshot()
+
+        embed = discord.Embed(
+            title="📡 API Statistics",
+            description=f"{sum(stats['requests'] for stats in snapshot.values())} requests sent",
+            color=discord.Color.blue()
+        )
+
+        for api, stats in list(snapshot.items())[:24]:
+            latency = stats['latency_ms']
+            statuses = " · ".join(
+                f"{status}×{count}" for status, count in sorted(stats['statuses'].items())
+            )
+            errors = " · ".join(f"{error}×{count}" for error, count in stats['errors'].items())
+            embed.add_field(
+                name=api,
+                value=(
+                    f"📨 {stats['requests']} sent · {stats['retries']} retries"
+                    f" · {stats['statuses'].get('429', 0)} throttled"
+                    f" · {stats['circuit_open']} fast-failed\n"
+                    f"⏱️ p50 {latency['p50']:.0f}ms · p95 {latency['p95']:.0f}ms"
+                    f" · p99 {latency['p99']:.0f}ms"
+                    f" · limiter wait p95 {stats['rate_limit_wait_ms']['p95']:.0f}ms\n"
+                    f"📥 {format_bytes(stats['bytes_received'])} received"
+                    f" · {statuses or 'no responses'}"
+                    + (f"\n⚠️ {errors}" if errors else "")
+                ),
+                inline=False
+            )
+
+        if not snapshot:
+            embed.add_field(name="No activity", value="No API requests recorded yet.")
+
+        await interaction.response.send_message(embed=embed, ephemeral=True)
     except Exception as e:
         await handle_error(interaction, e)
 
@@ -988,7 +1181,8 @@ async def help_command(interaction: discord.Interaction):
     embed.add_field(
         name="📊 Statistics",
         value="`/stats` - View gaming statistics\n"
-              "`/cache` - View cache statistics",
+              "`/cache` - View cache statistics\n"
+              "`/api_stats` - View Steam and deal API usage",
         inline=False
     )
 
@@ -1,9 +1,15 @@
 # ----- required imports -----
 
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Optional, Tuple
 from src.api import SteamAPI
 from src.database import db
 import asyncio
+import os
+
+# ----- environment initialization -----
+
+# Libraries fetched at a time when scanning a guild
+MATCHMAKING_BATCH_SIZE = int(os.getenv('MATCHMAKING_BATCH_SIZE', '50'))
 
 # ----- class definitions -----
 
@@ -22,11 +28,37 @@ class MatchmakingEngine:
             Dictionary with compatibility score and breakdown
         """
         # Get games for both users
-        games1, games2 = await asyncio.gather(
-            SteamAPI.get_owned_games(user1_steam_id),
-            SteamAPI.get_owned_games(user2_steam_id)
+        libraries = await SteamAPI.get_owned_games_many([user1_steam_id, user2_steam_id])
+
+        return self._compatibility_from_games(
+            libraries[user1_steam_id],
+            libraries[user2_steam_id]
         )
 
+    async def _get_member_libraries(self, steam_ids: List[str]) -> Dict[str, List[Dict]]:
+        """
+        Fetch member libraries MATCHMAKING_BATCH_SIZE at a time, leaving out
+        members whose library could not be fetched
+        """
+        libraries = {}
+        for start in range(0, len(steam_ids), MATCHMAKING_BATCH_SIZE):
+            batch = await SteamAPI.get_owned_games_many(
+                steam_ids[start:start + MATCHMAKING_BATCH_SIZE],
+                return_exceptions=True
+            )
+            for steam_id, games in batch.items():
+                if isinstance(games, BaseException):
+                    print(f"Skipping library for {steam_id}: {games}")
+                    continue
+                libraries[steam_id] = games
+        return libraries
+
+    def _compatibility_from_games(
+        self,
+        games1: List[Dict],
+        games2: List[Dict]
+    ) -> Dict[str, Any]:
+        """Score compatibility from two already-fetched libraries"""
         if not games1 or not games2:
             return {'score': 0, 'details': 'Insufficient data'}
 
@@ -101,7 +133,8 @@ class MatchmakingEngine:
         self,
         discord_id: int,
         guild_members: List[int],
-        limit: int = 5
+        limit: int = 5,
+        guild_id: Optional[int] = None
     ) -> List[Tuple[int, Dict[str, Any]]]:
         """
         Find best gaming matches from a list of Discord IDs
@@ -110,33 +143,31 @@ class MatchmakingEngine:
             discord_id: User's Discord ID
             guild_members: List of Discord IDs to check against
             limit: Max number of matches to return
+            guild_id: Guild the members belong to, to reuse recent ID lookups
 
         Returns:
             List of (discord_id, compatibility_data) tuples sorted by score
         """
-        # Get user's Steam ID
-        user_steam_id = await db.get_steam_id(discord_id)
+        # Get Steam IDs for the user and all guild members in one lookup
+        member_steam_ids = await db.get_steam_ids([discord_id, *guild_members], guild_id)
+
+        user_steam_id = member_steam_ids.pop(discord_id, None)
         if not user_steam_id:
             return []
 
-        # Get Steam IDs for all guild members
-        matches = []
-
-        for member_id in guild_members:
-            if member_id == discord_id:
-                continue
+        # The user's own library is required; members that fail are skipped
+        user_games = await SteamAPI.get_owned_games(user_steam_id)
+        libraries = await self._get_member_libraries(list(member_steam_ids.values()))
 
-            member_steam_id = await db.get_steam_id(member_id)
-            if not member_steam_id:
-                continue
-
-            # Calculate compatibility
-            compatibility = await self.calculate_compatibility(
-                user_steam_id,
-                member_steam_id
+        # Calculate compatibility
+        matches = [
+            (
+                member_id,
+                self._compatibility_from_games(user_games, libraries[member_steam_id])
             )
-
-            matches.append((member_id, compatibility))
+            for member_id, member_steam_id in member_steam_ids.items()
+            if member_steam_id in libraries
+        ]
 
         # Sort by compatibility score
         matches.sort(key=lambda x: x[1]['score'], reverse=True)
@@ -146,7 +177,8 @@ class MatchmakingEngine:
     async def find_players_for_game(
         self,
         game_name: str,
-        guild_members: List[int]
+        guild_members: List[int],
+        guild_id: Optional[int] = None
     ) -> List[Tuple[int, Dict[str, Any]]]:
         """
         Find guild members who own and play a specific game
@@ -154,19 +186,19 @@ class MatchmakingEngine:
         Args:
             game_name: Name of the game to search for
             guild_members: List of Discord IDs to check
+            guild_id: Guild the members belong to, to reuse recent ID lookups
 
         Returns:
             List of (discord_id, game_data) tuples
         """
         results = []
+        member_steam_ids = await db.get_steam_ids(guild_members, guild_id)
 
-        for member_id in guild_members:
-            steam_id = await db.get_steam_id(member_id)
-            if not steam_id:
-                continue
+        # Get their games in batches, skipping members whose library failed
+        libraries = await self._get_member_libraries(list(member_steam_ids.values()))
 
-            # Get their games
-            games = await SteamAPI.get_owned_games(steam_id)
+        for member_id, steam_id in member_steam_ids.items():
+            games = libraries.get(steam_id, [])
 
             # Search for the game
             for game in games:
@@ -0,0 +1,247 @@
+# ----- required imports -----
+
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from src.api import SteamAPI
+from src.client import BACKGROUND, UpstreamUnavailable, request_deadline, request_priority
+from src.database import Database, db
+import asyncio
+import os
+
+# ----- environment initialization -----
+
+METADATA_INGEST_ENABLED = os.getenv('METADATA_INGEST_ENABLED', 'true').lower() == 'true'
+# Seconds between passes over the cached libraries (new registrations wake it early)
+METADATA_INGEST_INTERVAL = float(os.getenv('METADATA_INGEST_INTERVAL', '3600'))
+METADATA_INGEST_BATCH_SIZE = int(os.getenv('METADATA_INGEST_BATCH_SIZE', '50'))
+# Concurrent Store requests; the appdetails rate limit still sets the pace
+METADATA_INGEST_CONCURRENCY = int(os.getenv('METADATA_INGEST_CONCURRENCY', '2'))
+
+# ----- steam category definitions -----
+
+# Steam Store category IDs grouped into the multiplayer types stored in game_metadata
+MULTIPLAYER_CATEGORIES = {
+    'multiplayer': {1, 9, 20, 24, 27, 36, 37, 38, 39, 44, 47, 48, 49},
+    'coop': {9, 38, 39, 48},
+    'online_coop': {38},
+    'local_coop': {24, 39, 44},
+    'competitive': {36, 37, 47, 49},
+    'online_pvp': {36},
+    'lan': {47, 48},
+    'mmo': {20}
+}
+
+RELEASE_DATE_FORMATS = ['%d %b, %Y', '%b %d, %Y', '%d %B, %Y', '%B %d, %Y', '%b %Y', '%B %Y', '%Y']
+
+# ----- helper functions -----
+
+def parse_release_date(release_date: Dict[str, Any]) -> Optional[str]:
+    """ISO date for the Store's localized release date, or the raw text if unparseable"""
+    text = (release_date or {}).get('date') or None
+    if text is None:
+        return None
+    for fmt in RELEASE_DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date().isoformat()
+        except ValueError:
+            continue
+    return text
+
+def extract_metadata(details: Dict[str, Any]) -> Dict[str, Any]:
+    """Reduce a Store appdetails payload to a game_metadata row"""
+    categories = sorted({int(category['id']) for category in details.get('categories', [])})
+    return {
+        'name': details.get('name') or f"App {details.get('steam_appid')}",
+        'genres': [genre['description'] for genre in details.get('genres', [])],
+        'categories': categories,
+        'multiplayer_types': [
+            kind for kind, ids in MULTIPLAYER_CATEGORIES.items()
+            if ids.intersection(categories)
+        ],
+        'release_date': parse_release_date(details.get('release_date')),
+        'metacritic_score': (details.get('metacritic') or {}).get('score')
+    }
+
+def category_mask(categories: Iterable[int]) -> int:
+    """Bitmask with bit n set for each Steam category ID n"""
+    mask = 0
+    for category in categories:
+        mask |= 1 << category
+    return mask
+
+FILTER_MASKS = {kind: category_mask(ids) for kind, ids in MULTIPLAYER_CATEGORIES.items()}
+
+# ----- class definitions -----
+
+class CapabilityIndex:
+    """
+    In-memory appid -> Steam category index built from game_metadata
+
+    Categories are kept as one bitmask per app, so filtering a library is
+    a dict lookup and a few ANDs per game. Filters are the multiplayer type
+    names in MULTIPLAYER_CATEGORIES and a game must match all of them.
+    """
+
+    def __init__(self):
+        self.masks: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.masks)
+
+    def __contains__(self, appid: int) -> bool:
+        return appid in self.masks
+
+    async def load(self, database: Database = db):
+        """Replace the index with everything in game_metadata"""
+        categories = await database.get_game_categories()
+        self.masks = {appid: category_mask(ids) for appid, ids in categories.items()}
+
+    def update(self, metadata: Dict[int, Dict[str, Any]]):
+        """Index freshly stored game_metadata rows"""
+        for appid, game in metadata.items():
+            self.masks[appid] = category_mask(game.get('categories', []))
+
+    def filter(
+        self,
+        games: List[Dict[str, Any]],
+        filters: Iterable[str]
+    ) -> Tuple[List[Dict[str, Any]], List[int]]:
+        """Split games into those matching every filter and the appids not indexed yet"""
+        required = [FILTER_MASKS[name] for name in filters]
+        matches = []
+        unknown = []
+        for game in games:
+            mask = self.masks.get(game['appid'])
+            if mask is None:
+                unknown.append(game['appid'])
+            elif all(mask & bits for bits in required):
+                matches.append(game)
+        return matches, unknown
+
+class MetadataIngestor:
+    """
+    Background worker that fills game_metadata from the Steam Store
+
+    Each pass looks up every appid in the cached libraries that has no
+    metadata yet, fetches its appdetails at background priority (so the
+    strict appdetails rate limit is spent on commands first) and upserts
+    the extracted rows in batches, adding them to the capability index.
+    Appids passed to enqueue() are fetched first. Apps the Store does not
+    know are skipped for the rest of the process lifetime.
+    """
+
+    def __init__(
+        self,
+        database: Database = db,
+        index: Optional[CapabilityIndex] = None,
+        interval: float = METADATA_INGEST_INTERVAL,
+        batch_size: int = METADATA_INGEST_BATCH_SIZE,
+        concurrency: int = METADATA_INGEST_CONCURRENCY
+    ):
+        self.db = database
+        self.index = capability_index if index is None else index
+        self.interval = interval
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.unknown_appids: Set[int] = set()
+        self._requested: Dict[int, None] = {}
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if not self.is_running:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    def notify(self):
+        """Start the next pass now, e.g. after a library was cached"""
+        self._wake.set()
+
+    def enqueue(self, appids: Iterable[int]):
+        """Resolve these appids at the start of the next pass, which starts now"""
+        for appid in appids:
+            if appid not in self.index and appid not in self.unknown_appids:
+                self._requested[appid] = None
+        if self._requested:
+            self.notify()
+
+    async def _run(self):
+        with request_priority(BACKGROUND), request_deadline(None):
+            while True:
+                self._wake.clear()
+                try:
+                    stored = await self.ingest_pending()
+                    if stored:
+                        print(f"Ingested metadata for {stored} games")
+                except Exception as e:
+                    print(f"Error ingesting game metadata: {e}")
+
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def ingest_pending(self) -> int:
+        """Run one pass; returns how many games were stored"""
+        requested, self._requested = self._requested, {}
+        missing = dict.fromkeys(await self.db.get_appids_missing_metadata())
+        appids = [
+            appid for appid in {**requested, **missing}
+            if appid not in self.unknown_appids and appid not in self.index
+        ]
+        queue = asyncio.Queue()
+        for appid in appids:
+            queue.put_nowait(appid)
+
+        batch: Dict[int, Dict[str, Any]] = {}
+        stored = 0
+
+        async def flush():
+            nonlocal batch, stored
+            rows, batch = batch, {}
+            if rows:
+                await self.db.cache_game_metadata_many(rows)
+                self.index.update(rows)
+                stored += len(rows)
+
+        async def worker():
+            while not queue.empty():
+                appid = queue.get_nowait()
+                try:
+                    details = await SteamAPI.fetch_game_details(appid)
+                except UpstreamUnavailable:
+                    # The Store is down or rate limited; pick up where we left off next pass
+                    return
+                except Exception as e:
+                    print(f"Error fetching metadata for {appid}: {e}")
+                    continue
+
+                if details is None:
+                    self.unknown_appids.add(appid)
+                    continue
+                batch[appid] = extract_metadata(details)
+                if len(batch) >= self.batch_size:
+                    await flush()
+
+        try:
+            await asyncio.gather(*[worker() for _ in range(self.concurrency)])
+        finally:
+            await flush()
+        return stored
+
+# ----- global metadata instances -----
+
+capability_index = CapabilityIndex()
+metadata_ingestor = MetadataIngestor()
@@ -1,119 +1,98 @@
 # ----- required imports -----
 
 from typing import List, Dict, Any, Optional
-from src.client import APIClient
-from src.cache import get_cache, set_cache
+from src.client import BACKGROUND, http_client, request_priority
+from src.cache import get_or_fetch
 import asyncio
+import os
+
+# ----- environment initialization -----
+
+ITAD_BASE_URL = os.getenv('ITAD_BASE_URL', 'https://api.isthereanydeal.com')
 
 # ----- class definitions -----
 
 class PriceTracker:
     """Track game prices and deals using IsThereAnyDeal API"""
 
-    def __init__(self):
-        self.base_url = "https://api.isthereanydeal.com"
+    def __init__(self, base_url: str = ITAD_BASE_URL):
+        self.base_url = base_url
         # IsThereAnyDeal doesn't require API key for basic features
 
     async def get_game_price(self, game_title: str) -> Optional[Dict[str, Any]]:
         """Get current price for a game"""
-        cache_key = f"price:{game_title}"
-        if cached := await get_cache(cache_key):
-            return cached
-
-        try:
+        async def fetch():
             # First, search for the game to get its plain ID
-            async with APIClient() as client:
-                search_data = await client.get(
-                    f"{self.base_url}/v01/search/search/",
-                    params={'q': game_title, 'limit': 1}
-                )
-
-                if not search_data.get('data', {}).get('results'):
-                    return None
-
-                plain_id = search_data['data']['results'][0]['plain']
-
-                # Get price data
-                price_data = await client.get(
-                    f"{self.base_url}/v01/game/prices/",
-                    params={
-                        'plains': plain_id,
-                        'region': 'us',
-                        'country': 'US'
-                    }
-                )
-
-                result = price_data.get('data', {}).get(plain_id, {})
-                await set_cache(cache_key, result, ttl=900)  # Cache for 15 minutes
-                return result
-
-        except Exception as e:
-            print(f"Error fetching price data: {e}")
-            return None
+            search_data = await http_client.get(
+                f"{self.base_url}/v01/search/search/",
+                params={'q': game_title, 'limit': 1}
+            )
+
+            if not search_data.get('data', {}).get('results'):
+                return None
+
+            plain_id = search_data['data']['results'][0]['plain']
+
+            # Get price data
+            price_data = await http_client.get(
+                f"{self.base_url}/v01/game/prices/",
+                params={
+                    'plains': plain_id,
+                    'region': 'us',
+                    'country': 'US'
+                }
+            )
+
+            return price_data.get('data', {}).get(plain_id, {})
+
+        return await get_or_fetch(f"price:{game_title}", fetch)
 
     async def get_current_deals(self, limit: int = 10) -> List[Dict[str, Any]]:
         """Get current game deals"""
-        cache_key = f"deals:current:{limit}"
-        if cached := await get_cache(cache_key):
-            return cached
-
-        try:
-            async with APIClient() as client:
-                deals = await client.get(
-                    f"{self.base_url}/v01/deals/list/",
-                    params={
-                        'region': 'us',
-                        'country': 'US',
-                        'limit': limit
-                    }
-                )
-
-                result = deals.get('data', {}).get('list', [])
-                await set_cache(cache_key, result, ttl=900)
-                return result
-
-        except Exception as e:
-            print(f"Error fetching deals: {e}")
-            return []
+        async def fetch():
+            deals = await http_client.get(
+                f"{self.base_url}/v01/deals/list/",
+                params={
+                    'region': 'us',
+                    'country': 'US',
+                    'limit': limit
+                },
+                api='deals'
+            )
+
+            return deals.get('data', {}).get('list', [])
+
+        return await get_or_fetch(f"deals:current:{limit}", fetch)
 
     async def get_price_history(
         self,
         game_title: str
     ) -> Optional[Dict[str, Any]]:
         """Get historical price data for a game"""
-        cache_key = f"price_history:{game_title}"
-        if cached := await get_cache(cache_key):
-            return cached
-
-        try:
-            async with APIClient() as client:
-                # Search for game
-                search_data = await client.get(
-                    f"{self.base_url}/v01/search/search/",
-                    params={'q': game_title, 'limit': 1}
-                )
-
-                if not search_data.get('data', {}).get('results'):
-                    return None
-
-                plain_id = search_data['data']['results'][0]['plain']
-
-                # Get historical data
-                history = await client.get(
-                    f"{self.base_url}/v01/game/history/",
-                    params={
-                        'plains': plain_id,
-                        'region': 'us'
-                    }
-                )
-
-                result = history.get('data', {}).get(plain_id, {})
-                await set_cache(cache_key, result, ttl=3600)  # Cache for 1 hour
-                return result
-
-        except Exception as e:
-            print(f"Error fetching price history: {e}")
-            return None
+        async def fetch():
+            # Search for game
+            search_data = await http_client.get(
+                f"{self.base_url}/v01/search/search/",
+                params={'q': game_title, 'limit': 1}
+            )
+
+            if not search_data.get('data', {}).get('results'):
+                return None
+
+            plain_id = search_data['data']['results'][0]['plain']
+
+            # Get historical data
+            history = await http_client.get(
+                f"{self.base_url}/v01/game/history/",
+                params={
+                    'plains': plain_id,
+                    'region': 'us'
+                }
+            )
+
+            return history.get('data', {}).get(plain_id, {})
+
+        return await get_or_fetch(f"price_history:{game_title}", fetch)
 
     async def check_price_alerts(
         self,
@@ -137,7 +116,13 @@ class PriceTracker:
             if not game_name or target_price is None:
                 continue
 
-            current_price_data = await self.get_game_price(game_name)
+            # Alert sweeps yield to user-facing commands at the rate limiter
+            try:
+                with request_priority(BACKGROUND):
+                    current_price_data = await self.get_game_price(game_name)
+            except Exception as e:
+                print(f"Skipping price alert for {game_name}: {e}")
+                continue
 
             if current_price_data:
                 # Get lowest current price across all stores
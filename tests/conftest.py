@@ -0,0 +1,50 @@
+# ----- required imports -----
+
+import pytest
+import os
+import tempfile
+import src.api as api_module
+import src.cache as cache_module
+import src.price_tracker as price_tracker_module
+from src.api import SteamAPI
+from src.cache import CacheMetrics, CompactSerializer, MemoryCache
+from src.client import APIClient, HTTPMetrics
+from src.database import Database
+from tests.fake_server import FakeUpstream
+
+# ----- shared fixtures -----
+
+@pytest.fixture
+async def fake_upstream(monkeypatch):
+    """Point SteamAPI and PriceTracker at a local fake with a fresh cache and client"""
+    upstream = FakeUpstream(library_size=(5, 30), retry_after=0)
+    url = await upstream.start()
+    client = APIClient(metrics=HTTPMetrics(), backoff=0)
+
+    monkeypatch.setattr(api_module, "STEAM_KEY", "test-key")
+    monkeypatch.setattr(SteamAPI, "api_base_url", url)
+    monkeypatch.setattr(SteamAPI, "store_base_url", url)
+    monkeypatch.setattr(api_module, "http_client", client)
+    monkeypatch.setattr(price_tracker_module, "http_client", client)
+    monkeypatch.setattr(cache_module, "cache", MemoryCache(max_size=1000, serializer=CompactSerializer()))
+    monkeypatch.setattr(cache_module, "local_cache", None)
+    monkeypatch.setattr(cache_module, "cache_metrics", CacheMetrics())
+
+    yield upstream
+
+    await client.close()
+    await upstream.close()
+
+@pytest.fixture
+async def test_db():
+    """Create a temporary test database"""
+    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.db')
+    temp_file.close()
+
+    db = Database(temp_file.name)
+    await db.initialize()
+
+    yield db
+
+    await db.close()
+    os.unlink(temp_file.name)
@@ -0,0 +1,376 @@
+# ----- required imports -----
+
+from aiohttp import ClientSession, web
+from collections import Counter, defaultdict, deque
+from typing import Any, Deque, Dict, List, Optional
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import re
+
+# ----- upstream definitions -----
+
+# Path prefix -> real upstream, used when recording
+UPSTREAMS = [
+    ('/api/', 'https://store.steampowered.com'),
+    ('/v01/', 'https://api.isthereanydeal.com'),
+    ('/', 'https://api.steampowered.com')
+]
+
+# Never written to recordings or used to look them up
+SECRET_PARAMS = {'key'}
+
+GENRES = ['Action', 'Adventure', 'RPG', 'Strategy', 'Simulation', 'Indie', 'Casual', 'Sports', 'Racing']
+CATEGORIES = [
+    (1, 'Multi-player'), (2, 'Single-player'), (9, 'Co-op'), (36, 'Online PvP'),
+    (38, 'Online Co-op'), (24, 'Shared/Split Screen'), (49, 'PvP')
+]
+SHOPS = ['Steam', 'GOG', 'Humble Store', 'Fanatical', 'GreenManGaming']
+
+# ----- class definitions -----
+
+class FakeUpstream:
+    """
+    Local stand-in for every Steam and IsThereAnyDeal endpoint the bot calls
+
+    Responses are replayed from `recordings` when one matches the request
+    and generated from a seeded RNG otherwise, so the same steam ID always
+    has the same library. Latency, server errors and 429s can be injected
+    at a fixed rate, or queued for the next requests to a path with
+    fail_next(). With `record=True`, misses are proxied to the real APIs
+    and kept in `recordings` for save().
+    """
+
+    def __init__(
+        self,
+        recordings: Optional[Dict[str, Any]] = None,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        throttle_rate: float = 0.0,
+        retry_after: int = 1,
+        library_size: tuple = (20, 200),
+        seed: int = 0,
+        record: bool = False
+    ):
+        self.recordings = recordings or {}
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.library_size = library_size
+        self.seed = seed
+        self.record = record
+        self.requests: Counter = Counter()
+        self._faults = random.Random(seed)
+        self._queued: Dict[str, Deque[int]] = defaultdict(deque)
+        self._runner: Optional[web.AppRunner] = None
+        self.url: Optional[str] = None
+
+        self.routes = {
+            '/IPlayerService/GetOwnedGames/v1/': self.owned_games,
+            '/IPlayerService/GetRecentlyPlayedGames/v1/': self.recently_played_games,
+            '/ISteamUser/GetPlayerSummaries/v2/': self.player_summaries,
+            '/ISteamUser/ResolveVanityURL/v1/': self.resolve_vanity_url,
+            '/ISteamUserStats/GetPlayerAchievements/v1/': self.player_achievements,
+            '/api/appdetails': self.app_details,
+            '/v01/search/search/': self.itad_search,
+            '/v01/game/prices/': self.itad_prices,
+            '/v01/game/history/': self.itad_history,
+            '/v01/deals/list/': self.itad_deals
+        }
+
+    # ----- lifecycle -----
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        for path in self.routes:
+            app.router.add_get(path, self.handle)
+        return app
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> str:
+        """Serve on host:port (0 picks a free port) and return the base URL"""
+        self._runner = web.AppRunner(self.app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        bound_host, bound_port = self._runner.addresses[0][:2]
+        self.url = f"http://{bound_host}:{bound_port}"
+        return self.url
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+        self._runner = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    # ----- fault injection -----
+
+    def fail_next(self, path: str, *statuses: int):
+        """Answer the next requests to path with these statuses, in order"""
+        self._queued[path].extend(statuses)
+
+    def _fault(self, path: str) -> Optional[int]:
+        if self._queued[path]:
+            return self._queued[path].popleft()
+        roll = self._faults.random()
+        if roll < self.throttle_rate:
+            return 429
+        if roll < self.throttle_rate + self.error_rate:
+            return 503
+        return None
+
+    # ----- recordings -----
+
+    @staticmethod
+    def recording_key(path: str, query: Dict[str, str]) -> str:
+        params = '&'.join(f"{k}={v}" for k, v in sorted(query.items()) if k not in SECRET_PARAMS)
+        return f"{path}?{params}"
+
+    def save(self, filename: str):
+        with open(filename, 'w') as f:
+            json.dump(self.recordings, f, indent=2, sort_keys=True)
+
+    @classmethod
+    def load(cls, filename: str, **kwargs) -> 'FakeUpstream':
+        with open(filename) as f:
+            return cls(recordings=json.load(f), **kwargs)
+
+    async def _record(self, path: str, query: Dict[str, str]) -> Any:
+        upstream = next(base for prefix, base in UPSTREAMS if path.startswith(prefix))
+        async with ClientSession() as session:
+            async with session.get(f"{upstream}{path}", params=query) as response:
+                response.raise_for_status()
+                return await response.json(content_type=None)
+
+    # ----- request handling -----
+
+    async def handle(self, request: web.Request) -> web.Response:
+        path = request.path
+        self.requests[path] += 1
+
+        if self.latency or self.jitter:
+            await asyncio.sleep(self.latency + self._faults.uniform(0, self.jitter))
+
+        status = self._fault(path)
+        if status == 429:
+            return web.Response(status=429, headers={'Retry-After': str(self.retry_after)})
+        if status is not None:
+            return web.Response(status=status)
+
+        query = dict(request.query)
+        key = self.recording_key(path, query)
+        if key not in self.recordings:
+            if self.record:
+                self.recordings[key] = await self._record(path, query)
+            else:
+                return web.json_response(self.routes[path](query))
+        return web.json_response(self.recordings[key])
+
+    # ----- synthetic responses -----
+
+    def _rng(self, *parts: Any) -> random.Random:
+        """RNG seeded by the request subject, so responses are stable across runs"""
+        digest = hashlib.blake2b(repr((self.seed, *parts)).encode(), digest_size=8).digest()
+        return random.Random(int.from_bytes(digest, 'big'))
+
+    def library(self, steam_id: str) -> List[Dict[str, Any]]:
+        rng = self._rng('library', steam_id)
+        # A shared pool of appids, so different users' libraries overlap
+        appids = rng.sample(range(10, 20000, 10), rng.randint(*self.library_size))
+        return [
+            {
+                'appid': appid,
+                'name': f"Game {appid}",
+                'playtime_forever': rng.choice([0, rng.randint(1, 50000)]),
+                'img_icon_url': hashlib.sha1(str(appid).encode()).hexdigest(),
+                'has_community_visible_stats': True,
+                'playtime_windows_forever': 0,
+                'playtime_mac_forever': 0,
+                'playtime_linux_forever': 0,
+                'playtime_deck_forever': 0,
+                'rtime_last_played': 1600000000 + rng.randint(0, 100000000),
+                'content_descriptorids': [2, 5],
+                'playtime_disconnected': 0
+            }
+            for appid in sorted(appids)
+        ]
+
+    def owned_games(self, query: Dict[str, str]) -> Dict[str, Any]:
+        steam_id = query.get('steamid', '')
+        if steam_id.endswith('0000'):
+            return {'response': {}}  # private profile
+        games = self.library(steam_id)
+        return {'response': {'game_count': len(games), 'games': games}}
+
+    def recently_played_games(self, query: Dict[str, str]) -> Dict[str, Any]:
+        played = [game for game in self.library(query.get('steamid', '')) if game['playtime_forever']]
+        games = [
+            {
+                'appid': game['appid'],
+                'name': game['name'],
+                'playtime_2weeks': min(game['playtime_forever'], 600),
+                'playtime_forever': game['playtime_forever']
+            }
+            for game in played[:5]
+        ]
+        return {'response': {'total_count': len(games), 'games': games}}
+
+    def player_summaries(self, query: Dict[str, str]) -> Dict[str, Any]:
+        players = [
+            {
+                'steamid': steam_id,
+                'personaname': f"Player {steam_id[-4:]}",
+                'profileurl': f"https://steamcommunity.com/profiles/{steam_id}/",
+                'avatarfull': f"https://avatars.example.com/{steam_id}_full.jpg",
+                'personastate': self._rng('state', steam_id).randint(0, 6),
+                'communityvisibilitystate': 3
+            }
+            for steam_id in query.get('steamids', '').split(',') if steam_id
+        ]
+        return {'response': {'players': players}}
+
+    def resolve_vanity_url(self, query: Dict[str, str]) -> Dict[str, Any]:
+        vanity = query.get('vanityurl', '')
+        if vanity.startswith('unknown'):
+            return {'response': {'success': 42, 'message': 'No match'}}
+        steam_id = str(76561197960265728 + self._rng('vanity', vanity).randint(1, 10 ** 9))
+        return {'response': {'steamid': steam_id, 'success': 1}}
+
+    def player_achievements(self, query: Dict[str, str]) -> Dict[str, Any]:
+        rng = self._rng('achievements', query.get('steamid'), query.get('appid'))
+        achievements = [
+            {
+                'apiname': f"ACH_{i}",
+                'achieved': int(rng.random() < 0.4),
+                'unlocktime': rng.randint(1600000000, 1700000000)
+            }
+            for i in range(rng.randint(0, 40))
+        ]
+        return {'playerstats': {'steamID': query.get('steamid'), 'achievements': achievements, 'success': True}}
+
+    def app_details(self, query: Dict[str, str]) -> Dict[str, Any]:
+        # Appids from 10**7 up are not in the Store
+        details = {}
+        for appid in query.get('appids', '').split(','):
+            rng = self._rng('appdetails', appid)
+            details[appid] = {
+                'success': True,
+                'data': {
+                    'type': 'game',
+                    'name': f"Game {appid}",
+                    'steam_appid': int(appid),
+                    'is_free': rng.random() < 0.1,
+                    'short_description': f"Synthetic game {appid}.",
+                    'genres': [
+                        {'id': str(i), 'description': genre}
+                        for i, genre in enumerate(rng.sample(GENRES, rng.randint(1, 3)))
+                    ],
+                    'categories': [
+                        {'id': category_id, 'description': description}
+                        for category_id, description in rng.sample(CATEGORIES, rng.randint(1, 4))
+                    ],
+                    'release_date': {'coming_soon': False, 'date': f"{rng.randint(1, 28)} Mar, {rng.randint(2004, 2024)}"},
+                    'metacritic': {'score': rng.randint(40, 98)}
+                }
+            } if appid.isdigit() and int(appid) < 10 ** 7 else {'success': False}
+        return details
+
+    @staticmethod
+    def _plain(title: str) -> str:
+        return re.sub(r'[^a-z0-9]', '', title.lower())
+
+    def _price_list(self, plain: str) -> List[Dict[str, Any]]:
+        rng = self._rng('prices', plain)
+        price_old = rng.choice([9.99, 19.99, 29.99, 59.99])
+        prices = []
+        for shop in rng.sample(SHOPS, rng.randint(1, len(SHOPS))):
+            cut = rng.choice([0, 0, 10, 25, 50, 75])
+            prices.append({
+                'price_new': round(price_old * (100 - cut) / 100, 2),
+                'price_old': price_old,
+                'price_cut': cut,
+                'url': f"https://{self._plain(shop)}.example.com/{plain}",
+                'shop': {'id': self._plain(shop), 'name': shop}
+            })
+        return prices
+
+    def itad_search(self, query: Dict[str, str]) -> Dict[str, Any]:
+        title = query.get('q', '')
+        if not title or title.startswith('unknown'):
+            return {'data': {'results': []}}
+        return {'data': {'results': [{'id': 1, 'plain': self._plain(title), 'title': title}]}}
+
+    def itad_prices(self, query: Dict[str, str]) -> Dict[str, Any]:
+        plain = query.get('plains', '')
+        return {'data': {plain: {'list': self._price_list(plain)}}}
+
+    def itad_history(self, query: Dict[str, str]) -> Dict[str, Any]:
+        plain = query.get('plains', '')
+        lowest = min(price['price_new'] for price in self._price_list(plain))
+        return {'data': {plain: {'lowest': {'price': lowest, 'cut': 0, 'recorded': 1600000000}}}}
+
+    def itad_deals(self, query: Dict[str, str]) -> Dict[str, Any]:
+        deals = []
+        for i in range(int(query.get('limit', 10))):
+            plain = f"deal{i}"
+            best = min(self._price_list(plain), key=lambda price: price['price_new'])
+            deals.append({
+                'plain': plain,
+                'title': f"Deal Game {i}",
+                'price_new': best['price_new'],
+                'price_old': best['price_old'],
+                'price_cut': best['price_cut'],
+                'shop': best['shop'],
+                'urls': {'buy': best['url']}
+            })
+        return {'data': {'count': len(deals), 'list': deals}}
+
+# ----- command line entry point -----
+
+async def serve(args: argparse.Namespace):
+    options = dict(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        seed=args.seed,
+        record=bool(args.record)
+    )
+    upstream = FakeUpstream.load(args.replay, **options) if args.replay else FakeUpstream(**options)
+    url = await upstream.start(args.host, args.port)
+    print(f"Serving fake Steam/ITAD APIs at {url}; point the bot at it with:")
+    print(f"  STEAM_API_BASE_URL={url} STEAM_STORE_BASE_URL={url} ITAD_BASE_URL={url}")
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        if args.record:
+            upstream.save(args.record)
+            print(f"Saved {len(upstream.recordings)} recordings to {args.record}")
+        await upstream.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Fake Steam and IsThereAnyDeal APIs for offline runs")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument('--jitter', type=float, default=0.0, help="up to this many extra seconds")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction answered with 503")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="fraction answered with 429")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--replay', help="JSON file of recorded responses to serve")
+    parser.add_argument('--record', help="proxy misses to the real APIs and save them to this file")
+    try:
+        asyncio.run(serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,110 @@
+# ----- required imports -----
+
+import pytest
+import asyncio
+import time
+from aiohttp import ClientResponseError
+import src.cache as cache_module
+from src.api import SteamAPI
+from src.price_tracker import PriceTracker
+
+# ----- test fixtures -----
+
+OWNED_GAMES_PATH = '/IPlayerService/GetOwnedGames/v1/'
+SUMMARIES_PATH = '/ISteamUser/GetPlayerSummaries/v2/'
+APPDETAILS_PATH = '/api/appdetails'
+
+@pytest.fixture
+def tracker(fake_upstream):
+    return PriceTracker(base_url=fake_upstream.url)
+
+# ----- tests -----
+
+@pytest.mark.asyncio
+async def test_owned_games_are_projected_and_cached(fake_upstream):
+    """Test libraries come back as compact records and repeat lookups hit the cache"""
+    games = await SteamAPI.get_owned_games("76561198000000001")
+    again = await SteamAPI.get_owned_games("76561198000000001")
+
+    assert games == again
+    assert 5 <= len(games) <= 30
+    assert set(games[0]) == {'appid', 'name', 'playtime_forever', 'rtime_last_played'}
+    assert fake_upstream.requests[OWNED_GAMES_PATH] == 1
+
+@pytest.mark.asyncio
+async def test_private_library_is_empty(fake_upstream):
+    """Test a profile without a games array yields no games"""
+    assert await SteamAPI.get_owned_games("76561198000000000") == []
+
+@pytest.mark.asyncio
+async def test_profile_lookups(fake_upstream):
+    """Test summaries, vanity resolution and store details against the fake"""
+    players = await SteamAPI.get_player_summaries(["76561198000000001", "76561198000000002"])
+    steam_id = await SteamAPI.resolve_vanity_url("moe")
+    details = await SteamAPI.get_game_details(570)
+
+    assert [p['steamid'] for p in players] == ["76561198000000001", "76561198000000002"]
+    assert steam_id.isdigit()
+    assert await SteamAPI.resolve_vanity_url("unknown-user") is None
+    assert details['steam_appid'] == 570
+
+@pytest.mark.asyncio
+async def test_price_lookups(tracker):
+    """Test ITAD search + prices and the deals list against the fake"""
+    price = await tracker.get_game_price("Dota 2")
+    deals = await tracker.get_current_deals(limit=5)
+
+    assert price['list']
+    assert len(deals) == 5
+    assert await tracker.get_game_price("unknown game") is None
+
+@pytest.mark.asyncio
+async def test_injected_throttling_is_retried(fake_upstream):
+    """Test queued 429s are retried and persistent ones surface"""
+    fake_upstream.fail_next(OWNED_GAMES_PATH, 429, 503)
+    assert await SteamAPI.get_owned_games("76561198000000001")
+    assert fake_upstream.requests[OWNED_GAMES_PATH] == 3
+
+    fake_upstream.throttle_rate = 1.0
+    with pytest.raises(ClientResponseError) as error:
+        await SteamAPI.get_owned_games("76561198000000002")
+    assert error.value.status == 429
+
+@pytest.mark.asyncio
+async def test_player_summaries_cached_per_id(fake_upstream):
+    """Test any later lookup of an already fetched ID is served from cache"""
+    await SteamAPI.get_player_summaries(["76561198000000001", "76561198000000002"])
+    players = await SteamAPI.get_player_summaries(["76561198000000002", "76561198000000001"])
+    single = await SteamAPI.get_player_summaries(["76561198000000001"])
+
+    assert [p['steamid'] for p in players] == ["76561198000000002", "76561198000000001"]
+    assert [p['steamid'] for p in single] == ["76561198000000001"]
+    assert fake_upstream.requests[SUMMARIES_PATH] == 1
+
+@pytest.mark.asyncio
+async def test_player_summaries_batched_across_callers(fake_upstream):
+    """Test concurrent misses are merged into one request per 100 IDs"""
+    steam_ids = [str(76561198000001000 + i) for i in range(250)]
+
+    results = await asyncio.gather(
+        *[SteamAPI.get_player_summaries([steam_id]) for steam_id in steam_ids]
+    )
+
+    assert all(players[0]['steamid'] == steam_id for steam_id, players in zip(steam_ids, results))
+    assert fake_upstream.requests[SUMMARIES_PATH] == 3
+
+@pytest.mark.asyncio
+async def test_failed_refresh_keeps_stale_value(fake_upstream):
+    """Test an upstream error during a background refresh is not cached over the stale value"""
+    details = await SteamAPI.get_game_details(570)
+
+    raw = await cache_module.cache.get("game_details:570")
+    raw['soft_expiry'] = time.time() - 1
+    await cache_module.cache.set("game_details:570", raw)
+
+    fake_upstream.fail_next(APPDETAILS_PATH, 500, 500, 500)
+    assert await SteamAPI.get_game_details(570) == details
+    await asyncio.gather(*cache_module._refresh_tasks)
+
+    assert fake_upstream.requests[APPDETAILS_PATH] == 4
+    assert await SteamAPI.get_game_details(570) == details
@@ -0,0 +1,396 @@
+# ----- required imports -----
+
+import pytest
+import asyncio
+import time
+import src.cache as cache_module
+from src.client import DeadlineExceeded, remaining_time, request_deadline
+from src.cache import (
+    LocalCache, CompactSerializer, MemoryCache, CacheMetrics, CacheEntry, TTLPolicy, MISSING, singleflight, get_cache, set_cache,
+    get_cache_many, set_cache_many, get_or_fetch, get_or_fetch_many, refresh_many,
+    negative_ttl, _unwrap, _should_refresh
+)
+
+# ----- test fixtures -----
+
+@pytest.fixture
+def local_cache():
+    return LocalCache(max_size=2, ttl=60)
+
+@pytest.fixture
+def memory_cache(monkeypatch):
+    """Swap the shared Redis cache for an in-memory one"""
+    memory = MemoryCache(max_size=100, serializer=CompactSerializer())
+    monkeypatch.setattr(cache_module, "cache", memory)
+    monkeypatch.setattr(cache_module, "local_cache", None)
+    monkeypatch.setattr(cache_module, "cache_metrics", CacheMetrics())
+    return memory
+
+class FakeLockClient:
+    """Just enough of a Redis client for the distributed fetch lock"""
+
+    def __init__(self):
+        self.locks = {}
+
+    async def set(self, key, value, nx=False, px=None):
+        if nx and key in self.locks:
+            return None
+        self.locks[key] = value
+        return True
+
+    async def eval(self, script, numkeys, key, token):
+        if self.locks.get(key) == token:
+            del self.locks[key]
+
+    async def exists(self, key):
+        return key in self.locks
+
+@pytest.fixture
+def locked_cache(memory_cache, monkeypatch):
+    """In-memory cache that takes the CACHE_DISTRIBUTED_LOCKS path"""
+    monkeypatch.setattr(cache_module, "DISTRIBUTED_LOCKS", True)
+    monkeypatch.setattr(cache_module, "_is_redis", lambda: True)
+    memory_cache.client = FakeLockClient()
+    memory_cache.RELEASE_SCRIPT = "release"
+    return memory_cache
+
+# ----- tests -----
+
+def test_local_cache_roundtrip(local_cache):
+    """Test storing and reading a local entry"""
+    local_cache.set("steam_games:1", [{'appid': 570}])
+
+    assert local_cache.get("steam_games:1") == [{'appid': 570}]
+    assert local_cache.get("steam_games:2") is None
+
+def test_local_cache_evicts_least_recently_used(local_cache):
+    """Test LRU eviction when the cache is full"""
+    local_cache.set("a", 1)
+    local_cache.set("b", 2)
+
+    # Touch "a" so "b" becomes the eviction candidate
+    local_cache.get("a")
+    local_cache.set("c", 3)
+
+    assert len(local_cache) == 2
+    assert local_cache.get("a") == 1
+    assert local_cache.get("b") is None
+    assert local_cache.get("c") == 3
+
+def test_local_cache_entry_expiry(local_cache, monkeypatch):
+    """Test entries expire after the shorter of both TTLs"""
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now)
+    local_cache.set("short", "value", ttl=5)
+    local_cache.set("long", "value", ttl=3600)
+
+    monkeypatch.setattr(time, "monotonic", lambda: now + 10)
+    assert local_cache.get("short") is None
+    assert local_cache.get("long") == "value"
+
+    monkeypatch.setattr(time, "monotonic", lambda: now + 61)
+    assert local_cache.get("long") is None
+
+def test_local_cache_invalidate(local_cache):
+    """Test explicit invalidation"""
+    local_cache.set("a", 1)
+    local_cache.invalidate("a")
+
+    assert local_cache.get("a") is None
+
+@pytest.mark.asyncio
+async def test_singleflight_coalesces_concurrent_calls():
+    """Test concurrent callers share one in-flight fetch"""
+    calls = 0
+
+    async def fetch():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return [{'appid': 570}]
+
+    results = await asyncio.gather(
+        *[singleflight("steam_games:1", fetch) for _ in range(10)]
+    )
+
+    assert calls == 1
+    assert all(r == [{'appid': 570}] for r in results)
+
+    # Once settled, the next miss fetches again
+    await singleflight("steam_games:1", fetch)
+    assert calls == 2
+
+@pytest.mark.asyncio
+async def test_singleflight_callers_keep_their_own_deadlines():
+    """Test the shared fetch ignores the first caller's deadline and each caller applies its own"""
+    deadlines = []
+
+    async def fetch():
+        deadlines.append(remaining_time())
+        await asyncio.sleep(0.05)
+        return [{'appid': 570}]
+
+    async def impatient():
+        with request_deadline(0.01):
+            return await singleflight("steam_games:1", fetch)
+
+    async def patient():
+        await asyncio.sleep(0)
+        return await singleflight("steam_games:1", fetch)
+
+    first, second = await asyncio.gather(impatient(), patient(), return_exceptions=True)
+
+    assert deadlines == [float('inf')]
+    assert isinstance(first, DeadlineExceeded)
+    assert second == [{'appid': 570}]
+
+def test_unwrap_legacy_entry_never_stale():
+    """Test entries written before soft expiry existed stay readable"""
+    entry = _unwrap([{'appid': 570}])
+
+    assert entry.value == [{'appid': 570}]
+    assert entry.soft_expiry == float('inf')
+    assert not _should_refresh(entry.soft_expiry, entry.delta)
+
+def test_should_refresh_around_soft_expiry():
+    """Test refresh is skipped well before and forced after soft expiry"""
+    now = time.time()
+
+    assert not _should_refresh(now + 3600, delta=0.0)
+    assert _should_refresh(now - 1, delta=0.0)
+
+@pytest.mark.asyncio
+async def test_get_or_fetch_serves_stale_while_refreshing(memory_cache):
+    """Test stale values are returned immediately and refreshed in the background"""
+    versions = iter(["v1", "v2"])
+
+    async def fetch():
+        return next(versions)
+
+    assert await get_or_fetch("vanity:moe", fetch, ttl=60) == "v1"
+
+    # Push the entry past its soft expiry but keep it within the stale window
+    raw = await memory_cache.get("vanity:moe")
+    raw['soft_expiry'] = time.time() - 1
+    await memory_cache.set("vanity:moe", raw)
+
+    assert await get_or_fetch("vanity:moe", fetch, ttl=60) == "v1"
+    await asyncio.gather(*cache_module._refresh_tasks)
+    assert await get_or_fetch("vanity:moe", fetch, ttl=60) == "v2"
+
+def test_compact_serializer_roundtrip():
+    """Test small and compressed payloads round-trip"""
+    serializer = CompactSerializer(compress_threshold=256)
+    small = {'appid': 570, 'name': 'Dota 2'}
+    library = [
+        {'appid': i, 'name': f'Game {i}', 'img_icon_url': 'a' * 40, 'playtime_forever': i}
+        for i in range(500)
+    ]
+
+    small_payload = serializer.dumps(small)
+    library_payload = serializer.dumps(library)
+
+    assert small_payload[:1] == CompactSerializer.MSGPACK
+    assert library_payload[:1] == CompactSerializer.MSGPACK_ZLIB
+    assert serializer.loads(small_payload) == small
+    assert serializer.loads(library_payload) == library
+
+def test_compact_serializer_reads_legacy_json():
+    """Test entries written by JsonSerializer are still readable"""
+    serializer = CompactSerializer()
+
+    assert serializer.loads(b'[{"appid": 570}]') == [{'appid': 570}]
+    assert serializer.loads(b'"76561198000000000"') == "76561198000000000"
+    assert serializer.loads(None) is None
+
+@pytest.mark.asyncio
+async def test_get_or_fetch_caches_empty_results(memory_cache):
+    """Test empty lookups are cached and distinguishable from absent keys"""
+    calls = 0
+
+    async def fetch():
+        nonlocal calls
+        calls += 1
+        return []
+
+    assert await get_cache("steam_games:private", MISSING) is MISSING
+
+    assert await get_or_fetch("steam_games:private", fetch) == []
+    assert await get_or_fetch("steam_games:private", fetch) == []
+    assert calls == 1
+    assert await get_cache("steam_games:private", MISSING) == []
+
+def test_negative_ttl_by_key_family():
+    """Test negative TTLs are looked up by key prefix"""
+    assert negative_ttl("steam_games:1") == 600
+    assert negative_ttl("deals:current:10") == 60
+    assert negative_ttl("unknown:1") == 60
+
+@pytest.mark.asyncio
+async def test_cache_many_roundtrip(memory_cache):
+    """Test bulk reads omit absent keys"""
+    await set_cache_many({"steam_games:1": [{'appid': 570}], "steam_games:2": []})
+
+    cached = await get_cache_many(["steam_games:1", "steam_games:2", "steam_games:3"])
+
+    assert cached == {"steam_games:1": [{'appid': 570}], "steam_games:2": []}
+
+@pytest.mark.asyncio
+async def test_get_or_fetch_many_only_fetches_misses(memory_cache):
+    """Test batch lookups go to the source for misses only"""
+    await set_cache("steam_games:1", [{'appid': 570}])
+    fetched = []
+
+    async def fetch(key):
+        fetched.append(key)
+        return [{'appid': 730}]
+
+    results = await get_or_fetch_many(["steam_games:1", "steam_games:2"], fetch)
+
+    assert fetched == ["steam_games:2"]
+    assert results == {
+        "steam_games:1": [{'appid': 570}],
+        "steam_games:2": [{'appid': 730}]
+    }
+    assert await get_cache("steam_games:2") == [{'appid': 730}]
+
+@pytest.mark.asyncio
+async def test_get_or_fetch_many_pipelines_writes(memory_cache, monkeypatch):
+    """Test fetched misses are written back in one batch rather than one SET each"""
+    writes = []
+    multi_set = memory_cache.multi_set
+
+    async def spy(pairs, *args, **kwargs):
+        writes.append([key for key, _ in pairs])
+        return await multi_set(pairs, *args, **kwargs)
+
+    monkeypatch.setattr(memory_cache, "multi_set", spy)
+
+    async def fetch(key):
+        return [{'appid': 730}]
+
+    await get_or_fetch_many(["steam_games:1", "steam_games:2", "steam_games:3"], fetch)
+
+    assert writes == [["steam_games:1", "steam_games:2", "steam_games:3"]]
+
+@pytest.mark.asyncio
+async def test_get_or_fetch_many_keeps_successes_when_one_key_fails(memory_cache):
+    """Test a failing key neither discards nor blocks caching of the other misses"""
+    async def fetch(key):
+        if key == "steam_games:2":
+            raise RuntimeError("upstream down")
+        return [{'appid': 730}]
+
+    keys = ["steam_games:1", "steam_games:2", "steam_games:3"]
+    with pytest.raises(RuntimeError):
+        await get_or_fetch_many(keys, fetch)
+
+    assert await get_cache_many(keys) == {
+        "steam_games:1": [{'appid': 730}],
+        "steam_games:3": [{'appid': 730}]
+    }
+
+    results = await get_or_fetch_many(keys, fetch, return_exceptions=True)
+    assert isinstance(results.pop("steam_games:2"), RuntimeError)
+    assert results == {
+        "steam_games:1": [{'appid': 730}],
+        "steam_games:3": [{'appid': 730}]
+    }
+
+@pytest.mark.asyncio
+async def test_refresh_many_bypasses_cached_values(memory_cache):
+    """Test refreshes always go to the source and a failed one keeps the cached entry"""
+    await set_cache_many({"steam_games:1": [{'appid': 570}], "steam_games:2": [{'appid': 570}]})
+
+    async def fetch(key):
+        if key == "steam_games:2":
+            raise RuntimeError("upstream down")
+        return [{'appid': 730}]
+
+    results = await refresh_many(["steam_games:1", "steam_games:2"], fetch, return_exceptions=True)
+
+    assert results["steam_games:1"] == [{'appid': 730}]
+    assert isinstance(results["steam_games:2"], RuntimeError)
+    assert await get_cache_many(["steam_games:1", "steam_games:2"]) == {
+        "steam_games:1": [{'appid': 730}],
+        "steam_games:2": [{'appid': 570}]
+    }
+
+@pytest.mark.asyncio
+async def test_refresh_many_with_locks_reaches_the_source(locked_cache):
+    """Test a forced refresh skips the fresh-value shortcuts of the distributed lock path"""
+    await set_cache("steam_games:1", [{'appid': 570}])
+    await set_cache("steam_games:2", [{'appid': 570}])
+    # Another process holds the lock for one key
+    locked_cache.client.locks[locked_cache.build_key("lock:steam_games:2")] = "other"
+    fetched = []
+
+    async def fetch(key):
+        fetched.append(key)
+        return [{'appid': 730}]
+
+    results = await refresh_many(["steam_games:1", "steam_games:2"], fetch)
+
+    assert sorted(fetched) == ["steam_games:1", "steam_games:2"]
+    assert results == {"steam_games:1": [{'appid': 730}], "steam_games:2": [{'appid': 730}]}
+    assert await get_cache("steam_games:1") == [{'appid': 730}]
+
+@pytest.mark.asyncio
+async def test_memory_cache_evicts_least_recently_used():
+    """Test the memory backend evicts like Redis under allkeys-lru"""
+    memory = MemoryCache(max_size=2)
+    await memory.set("a", 1)
+    await memory.set("b", 2)
+
+    # Touch "a" so "b" becomes the eviction candidate
+    await memory.get("a")
+    await memory.set("c", 3)
+
+    assert await memory.multi_get(["a", "b", "c"]) == [1, None, 3]
+
+@pytest.mark.asyncio
+async def test_metrics_by_key_family(memory_cache):
+    """Test lookups and writes are recorded per key prefix"""
+    async def fetch():
+        return [{'appid': 570}]
+
+    await get_or_fetch("steam_games:1", fetch)
+    await get_or_fetch("steam_games:1", fetch)
+    await get_cache("price:Dota 2")
+
+    snapshot = cache_module.cache_metrics.snapshot()
+    assert snapshot['steam_games']['misses'] == 1
+    assert snapshot['steam_games']['hits'] == 1
+    assert snapshot['steam_games']['hit_ratio'] == 0.5
+    assert snapshot['steam_games']['sets'] == 1
+    assert snapshot['steam_games']['value_size_bytes']['count'] == 1
+    assert snapshot['price']['misses'] == 1
+
+def test_ttl_policy_adapts_to_change_rate():
+    """Test unchanged values are kept longer and changed values shorter, within bounds"""
+    policy = TTLPolicy({'steam_games': 3600}, min_ttl=60, max_ttl=86400)
+    key = "steam_games:1"
+
+    assert policy.next_ttl(key, "a", previous=None) == 3600
+
+    unchanged = CacheEntry([], 0.0, 0.0, ttl=3600, digest="a")
+    assert policy.next_ttl(key, "a", unchanged) == 5400
+
+    changed = CacheEntry([], 0.0, 0.0, ttl=3600, digest="a")
+    assert policy.next_ttl(key, "b", changed) == 1800
+
+    # Never beyond base * max_factor, nor below base * min_factor
+    long_lived = CacheEntry([], 0.0, 0.0, ttl=3600 * 8, digest="a")
+    assert policy.next_ttl(key, "a", long_lived) == 3600 * 8
+    short_lived = CacheEntry([], 0.0, 0.0, ttl=900, digest="a")
+    assert policy.next_ttl(key, "b", short_lived) == 900
+
+def test_library_fingerprint_ignores_playtime():
+    """Test only purchases change a library's fingerprint"""
+    policy = TTLPolicy({})
+    before = [{'appid': 570, 'playtime_forever': 10}, {'appid': 730, 'playtime_forever': 5}]
+    played = [{'appid': 730, 'playtime_forever': 50}, {'appid': 570, 'playtime_forever': 10}]
+    bought = before + [{'appid': 440, 'playtime_forever': 0}]
+
+    assert policy.fingerprint("steam_games:1", before) == policy.fingerprint("steam_games:1", played)
+    assert policy.fingerprint("steam_games:1", before) != policy.fingerprint("steam_games:1", bought)
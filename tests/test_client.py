@@ -0,0 +1,266 @@
+# ----- required imports -----
+
+import pytest
+import asyncio
+import json
+import time
+from aiohttp import ClientResponseError, web
+from aiohttp.test_utils import TestServer
+from src.client import (
+    APIClient, BACKGROUND, INTERACTIVE, CircuitBreaker, CircuitOpenError, DeadlineExceeded, HTTPMetrics, ObjectArrayParser,
+    RateLimiter, TokenBucket, api_name, remaining_time, request_deadline, request_priority
+)
+
+# ----- test fixtures -----
+
+OWNED_GAMES = {
+    'response': {
+        'game_count': 3,
+        'games': [
+            {'appid': 570, 'name': 'Dota 2', 'playtime_forever': 120, 'img_icon_url': 'abc',
+             'rtime_last_played': 1700000000, 'content_descriptorids': [2, 5]},
+            {'appid': 440, 'name': 'Team "Fortress" {2}', 'playtime_forever': 0,
+             'has_community_visible_stats': True},
+            {'appid': 730, 'name': 'Counter-Strike \\ 2 ]', 'playtime_forever': 5,
+             'playtime_by_platform': {'windows': 5, 'linux': 0}}
+        ]
+    }
+}
+
+@pytest.fixture
+async def echo_server():
+    """Local server that echoes query parameters back as JSON"""
+    async def echo(request):
+        return web.json_response(dict(request.query))
+
+    async def owned_games(request):
+        return web.json_response(OWNED_GAMES)
+
+    app = web.Application()
+    app.router.add_get('/echo', echo)
+    app.router.add_get('/owned_games', owned_games)
+    server = TestServer(app)
+    await server.start_server()
+
+    yield server
+
+    await server.close()
+
+@pytest.fixture
+async def failing_server():
+    """Local server whose /fail endpoint always answers 503 and records each request"""
+    async def fail(request):
+        server.requests.append(request.path)
+        return web.Response(status=503)
+
+    app = web.Application()
+    app.router.add_get('/fail', fail)
+    server = TestServer(app)
+    server.requests = []
+    await server.start_server()
+
+    yield server
+
+    await server.close()
+
+# ----- tests -----
+
+@pytest.mark.asyncio
+async def test_client_reuses_session(echo_server):
+    """Test the pool is opened once and reused across requests"""
+    client = APIClient()
+    await client.start()
+    session = client.session
+
+    await client.start()
+    data = await client.get(str(echo_server.make_url('/echo')), params={'appids': '570'})
+
+    assert client.session is session
+    assert data == {'appids': '570'}
+
+    await client.close()
+    assert not client.is_running
+
+@pytest.mark.asyncio
+async def test_client_starts_lazily(echo_server):
+    """Test a request on a client that was never started opens the pool"""
+    client = APIClient()
+
+    data = await client.get(str(echo_server.make_url('/echo')))
+
+    assert data == {}
+    assert client.is_running
+    await client.close()
+
+def test_rate_limiter_routes_appdetails_to_stricter_bucket():
+    """Test Store appdetails gets its own bucket and unknown hosts are not limited"""
+    limiter = RateLimiter(shared=False)
+
+    appdetails = limiter.bucket_for("https://store.steampowered.com/api/appdetails?appids=570")
+    web_api = limiter.bucket_for("https://api.steampowered.com/IPlayerService/GetOwnedGames/v1/")
+
+    assert appdetails.name == 'steam_appdetails'
+    assert web_api.name == 'steam_api'
+    assert appdetails.rate < web_api.rate
+    assert limiter.bucket_for("http://127.0.0.1:8080/echo") is None
+
+@pytest.mark.asyncio
+async def test_token_bucket_serves_interactive_lane_first():
+    """Test queued interactive requests get tokens before earlier background ones"""
+    bucket = TokenBucket('test', rate=50, capacity=1, shared=False)
+    await bucket.acquire()
+    order = []
+
+    async def request(name, priority):
+        with request_priority(priority):
+            await bucket.acquire()
+        order.append(name)
+
+    background = [asyncio.create_task(request(f'background-{i}', BACKGROUND)) for i in range(3)]
+    await asyncio.sleep(0)
+    interactive = asyncio.create_task(request('interactive', INTERACTIVE))
+    await asyncio.gather(*background, interactive)
+
+    assert order == ['interactive', 'background-0', 'background-1', 'background-2']
+    assert bucket.waiting == 0
+
+def test_circuit_breaker_opens_and_probes(monkeypatch):
+    """Test the breaker opens after repeated failures and lets one probe through later"""
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now)
+    breaker = CircuitBreaker('store', failure_threshold=2, reset_timeout=30)
+
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert not breaker.allow()
+
+    monkeypatch.setattr(time, "monotonic", lambda: now + 31)
+    assert breaker.allow()
+    assert breaker.state == 'half_open'
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == 'closed'
+    assert breaker.allow()
+
+@pytest.mark.asyncio
+async def test_client_fails_fast_while_breaker_open(failing_server):
+    """Test an open breaker stops requests from reaching a failing endpoint"""
+    client = APIClient(attempts=1)
+    url = str(failing_server.make_url('/fail'))
+    client.breaker_for(url).failure_threshold = 2
+
+    for _ in range(2):
+        with pytest.raises(ClientResponseError):
+            await client.get(url)
+    with pytest.raises(CircuitOpenError):
+        await client.get(url)
+
+    assert len(failing_server.requests) == 2
+    await client.close()
+
+@pytest.mark.asyncio
+async def test_probe_released_when_deadline_runs_out(failing_server):
+    """Test a half-open probe that never reaches the endpoint lets the next call probe"""
+    client = APIClient(attempts=1)
+    url = str(failing_server.make_url('/fail'))
+    breaker = client.breaker_for(url)
+    breaker.failure_threshold = 1
+
+    with pytest.raises(ClientResponseError):
+        await client.get(url)
+    breaker.opened_at -= breaker.reset_timeout
+
+    with request_deadline(0):
+        with pytest.raises(DeadlineExceeded):
+            await client.get(url)
+    assert breaker.state == 'half_open'
+
+    with pytest.raises(ClientResponseError):
+        await client.get(url)
+    assert len(failing_server.requests) == 2
+    await client.close()
+
+@pytest.mark.asyncio
+async def test_client_skips_retry_past_deadline(failing_server):
+    """Test no retry starts when it could not finish before the deadline"""
+    client = APIClient(attempts=3, backoff=1, min_attempt_time=0.5)
+
+    with request_deadline(1):
+        with pytest.raises(ClientResponseError):
+            await client.get(str(failing_server.make_url('/fail')))
+
+    assert len(failing_server.requests) == 1
+    assert remaining_time() == float('inf')
+    await client.close()
+
+def test_object_array_parser_projects_across_chunks():
+    """Test array elements split at arbitrary chunk boundaries are projected"""
+    payload = json.dumps(OWNED_GAMES).encode()
+    fields = ('appid', 'name', 'playtime_forever', 'rtime_last_played')
+    expected = [
+        {field: game[field] for field in fields if field in game}
+        for game in OWNED_GAMES['response']['games']
+    ]
+
+    for size in (1, 7, 64, len(payload)):
+        parser = ObjectArrayParser('games', fields)
+        for i in range(0, len(payload), size):
+            parser.feed(payload[i:i + size])
+        assert parser.close() == expected
+
+def test_object_array_parser_handles_missing_and_truncated_arrays():
+    """Test private libraries parse as empty and cut-off bodies raise"""
+    empty = ObjectArrayParser('games', ['appid'])
+    empty.feed(b'{"response": {}}')
+    assert empty.close() == []
+
+    truncated = ObjectArrayParser('games', ['appid'])
+    truncated.feed(b'{"response": {"games": [{"appid": 570}, {"app')
+    with pytest.raises(ValueError):
+        truncated.close()
+
+@pytest.mark.asyncio
+async def test_client_streams_response(echo_server):
+    """Test a streamed request returns the parser's projection"""
+    client = APIClient()
+
+    games = await client.get(
+        str(echo_server.make_url('/owned_games')),
+        stream=lambda: ObjectArrayParser('games', ['appid'])
+    )
+
+    assert games == [{'appid': 570}, {'appid': 440}, {'appid': 730}]
+    await client.close()
+
+def test_api_name_from_url():
+    """Test requests are tagged with their logical API"""
+    assert api_name("https://api.steampowered.com/IPlayerService/GetOwnedGames/v1/") == 'GetOwnedGames'
+    assert api_name("https://store.steampowered.com/api/appdetails") == 'appdetails'
+    assert api_name("https://api.isthereanydeal.com/v01/game/prices/") == 'prices'
+
+@pytest.mark.asyncio
+async def test_client_records_metrics_per_api(echo_server, failing_server):
+    """Test responses, retries, status codes and bytes are recorded per API"""
+    metrics = HTTPMetrics()
+    client = APIClient(metrics=metrics, attempts=2, backoff=0)
+
+    await client.get(str(echo_server.make_url('/owned_games')), api='GetOwnedGames')
+    with pytest.raises(ClientResponseError):
+        await client.get(str(failing_server.make_url('/fail')))
+
+    snapshot = metrics.snapshot()
+    owned = snapshot['GetOwnedGames']
+    assert owned['requests'] == 1
+    assert owned['statuses'] == {'200': 1}
+    assert owned['bytes_received'] == len(json.dumps(OWNED_GAMES))
+    assert owned['latency_ms']['count'] == 1
+
+    failing = snapshot['fail']
+    assert failing['requests'] == 2
+    assert failing['retries'] == 1
+    assert failing['statuses'] == {'503': 2}
+    assert failing['failure_ratio'] == 1.0
+    await client.close()
@@ -2,25 +2,52 @@
 
 import pytest
 import asyncio
+import inspect
+import json
 import os
+import re
+import sqlite3
 import tempfile
-from src.database import Database
+from datetime import datetime, timedelta
+from src.database import MIGRATIONS, SCHEMA, Database
 
 # ----- test fixtures -----
 
-@pytest.fixture
-async def test_db():
-    """Create a temporary test database"""
-    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.db')
-    temp_file.close()
-
-    db = Database(temp_file.name)
-    await db.initialize()
-
-    yield db
-
-    # Cleanup
-    os.unlink(temp_file.name)
+# One representative call per Database query method, run in order against one database
+DATABASE_CALLS = [
+    ('register_user', lambda db: db.register_user(1, "76561198000000001", "moe")),
+    ('get_user', lambda db: db.get_user(1)),
+    ('get_steam_id', lambda db: db.get_steam_id(1)),
+    ('get_steam_ids', lambda db: db.get_steam_ids([1, 2])),
+    ('get_users_by_steam_ids', lambda db: db.get_users_by_steam_ids(["76561198000000001", "76561198000000002"])),
+    ('cache_user_games', lambda db: db.cache_user_games("76561198000000001", [{'appid': 570, 'name': 'Dota 2'}])),
+    ('get_user_games', lambda db: db.get_user_games("76561198000000001")),
+    ('get_stale_libraries', lambda db: db.get_stale_libraries(["76561198000000001"], 3600)),
+    ('get_synced_libraries', lambda db: db.get_synced_libraries(["76561198000000001", "76561198000000002"])),
+    ('get_shared_games', lambda db: db.get_shared_games(["76561198000000001", "76561198000000002"], 1)),
+    ('get_appids_missing_metadata', lambda db: db.get_appids_missing_metadata()),
+    ('create_game_event', lambda db: db.create_game_event(5, "Dota 2", datetime.now() + timedelta(days=1), 1, participants=[1, 2])),
+    ('get_upcoming_events', lambda db: db.get_upcoming_events(5)),
+    ('get_upcoming_events', lambda db: db.get_upcoming_events(5, discord_id=2)),
+    ('update_event_status', lambda db: db.update_event_status(1, 'completed')),
+    ('add_price_alert', lambda db: db.add_price_alert(1, 570, "Dota 2", 9.99)),
+    ('get_user_alerts', lambda db: db.get_user_alerts(1)),
+    ('get_all_active_alerts', lambda db: db.get_all_active_alerts()),
+    ('mark_alert_notified', lambda db: db.mark_alert_notified(1)),
+    ('create_lfg_post', lambda db: db.create_lfg_post(5, 1, "Dota 2")),
+    ('get_active_lfg_posts', lambda db: db.get_active_lfg_posts(5)),
+    ('close_lfg_post', lambda db: db.close_lfg_post(1)),
+    ('cache_game_metadata', lambda db: db.cache_game_metadata(570, {'name': 'Dota 2', 'genres': ['Action'], 'categories': [1]})),
+    ('cache_game_metadata_many', lambda db: db.cache_game_metadata_many({730: {'name': 'CS2'}})),
+    ('get_game_metadata', lambda db: db.get_game_metadata(570)),
+    ('get_game_categories', lambda db: db.get_game_categories()),
+    ('set_user_preferences', lambda db: db.set_user_preferences(1, preferred_genres=['Action'])),
+    ('get_user_preferences', lambda db: db.get_user_preferences(1)),
+    ('unregister_user', lambda db: db.unregister_user(1)),
+]
+
+# Methods that return a whole table, where a full scan is the right plan
+FULL_TABLE_READS = {'get_game_categories'}
 
 # ----- tests -----
 
@@ -69,6 +96,33 @@ async def test_get_steam_id(test_db):
     steam_id = await test_db.get_steam_id(123456789)
     assert steam_id == "76561198000000000"
 
+@pytest.mark.asyncio
+async def test_get_steam_ids_in_bulk(test_db, monkeypatch):
+    """Test many Discord IDs resolve across parameter-limit chunks, skipping unregistered ones"""
+    monkeypatch.setattr('src.database.SQLITE_MAX_VARIABLES', 2)
+    for discord_id in (1, 2, 3):
+        await test_db.register_user(discord_id, f"7656119800000000{discord_id}")
+
+    steam_ids = await test_db.get_steam_ids([3, 4, 1, 2, 3])
+
+    assert steam_ids == {3: "76561198000000003", 1: "76561198000000001", 2: "76561198000000002"}
+    assert list(steam_ids) == [3, 1, 2]
+
+@pytest.mark.asyncio
+async def test_get_steam_ids_memoized_per_guild(test_db):
+    """Test guild lookups are remembered until a registration changes"""
+    await test_db.register_user(1, "76561198000000001")
+    statements = []
+    for connection in test_db._connections:
+        await connection.set_trace_callback(statements.append)
+
+    assert await test_db.get_steam_ids([1, 2], guild_id=5) == {1: "76561198000000001"}
+    assert await test_db.get_steam_ids([2, 1], guild_id=5) == {1: "76561198000000001"}
+    assert len([sql for sql in statements if sql.startswith('SELECT')]) == 1
+
+    await test_db.register_user(2, "76561198000000002")
+    assert await test_db.get_steam_ids([1, 2], guild_id=5) == {1: "76561198000000001", 2: "76561198000000002"}
+
 @pytest.mark.asyncio
 async def test_cache_user_games(test_db):
     """Test caching user games"""
@@ -88,6 +142,154 @@ async def test_cache_user_games(test_db):
     assert cached_games[0]['appid'] == 570
     assert cached_games[0]['playtime_forever'] == 10000
 
+@pytest.mark.asyncio
+async def test_cache_user_games_syncs_incrementally(test_db):
+    """Test a resync only touches added, changed and removed games"""
+    steam_id = "76561198000000000"
+
+    changes = await test_db.cache_user_games(steam_id, [
+        {'appid': 570, 'name': 'Dota 2', 'playtime_forever': 10000},
+        {'appid': 730, 'name': 'CS:GO', 'playtime_forever': 5000},
+        {'appid': 440, 'name': 'Team Fortress 2', 'playtime_forever': 100}
+    ])
+    assert sorted(changes.added) == [440, 570, 730]
+
+    changes = await test_db.cache_user_games(steam_id, [
+        {'appid': 570, 'name': 'Dota 2', 'playtime_forever': 10000},
+        {'appid': 730, 'name': 'CS:GO', 'playtime_forever': 5200},
+        {'appid': 620, 'name': 'Portal 2', 'playtime_forever': 0}
+    ])
+    assert changes == ([620], [730], [440])
+
+    cached_games = await test_db.get_user_games(steam_id)
+    assert [(g['appid'], g['playtime_forever']) for g in cached_games] == [(570, 10000), (730, 5200), (620, 0)]
+
+    # An unchanged library is a no-op
+    assert not await test_db.cache_user_games(steam_id, [
+        {'appid': 570, 'name': 'Dota 2', 'playtime_forever': 10000},
+        {'appid': 730, 'name': 'CS:GO', 'playtime_forever': 5200},
+        {'appid': 620, 'name': 'Portal 2', 'playtime_forever': 0}
+    ])
+
+@pytest.mark.asyncio
+async def test_shared_games_with_owner_threshold(test_db):
+    """Test shared libraries are intersected in SQL, optionally for k of n owners"""
+    await test_db.cache_user_games("1", [
+        {'appid': 570, 'name': 'Dota 2', 'playtime_forever': 100},
+        {'appid': 730, 'name': 'CS:GO', 'playtime_forever': 50}
+    ])
+    await test_db.cache_user_games("2", [
+        {'appid': 570, 'name': 'Dota 2', 'playtime_forever': 30},
+        {'appid': 440, 'name': 'TF2', 'playtime_forever': 900}
+    ])
+    await test_db.cache_user_games("3", [
+        {'appid': 570, 'name': 'Dota 2', 'playtime_forever': 0},
+        {'appid': 730, 'name': 'CS:GO', 'playtime_forever': 5}
+    ])
+
+    shared = await test_db.get_shared_games(["1", "2", "3"])
+    assert shared == [{'appid': 570, 'name': 'Dota 2', 'owners': 3, 'playtimes': {'1': 100, '2': 30, '3': 0}}]
+
+    shared = await test_db.get_shared_games(["1", "2", "3"], min_owners=2)
+    assert [(game['appid'], game['owners']) for game in shared] == [(570, 3), (730, 2)]
+    assert shared[1]['playtimes'] == {'1': 50, '3': 5}
+
+@pytest.mark.asyncio
+async def test_stale_libraries(test_db):
+    """Test libraries count as fresh only when synced within the max age, and as synced once ever synced"""
+    await test_db.cache_user_games("1", [{'appid': 570, 'name': 'Dota 2'}])
+    async with test_db.writer() as db:
+        await db.execute("UPDATE library_syncs SET synced_at = datetime('now', '-2 hours')")
+        await db.commit()
+    await test_db.cache_user_games("2", [])
+
+    assert await test_db.get_stale_libraries(["1", "2", "3"], 3600) == ["1", "3"]
+    assert await test_db.get_stale_libraries(["1", "2"], 3 * 3600) == []
+    assert await test_db.get_synced_libraries(["3", "1", "2"]) == ["1", "2"]
+
+@pytest.mark.asyncio
+async def test_connection_pool_settings(test_db):
+    """Test pooled connections use WAL and the tuned pragmas, and readers cannot write"""
+    async with test_db.reader() as db:
+        async with db.execute("PRAGMA journal_mode") as cursor:
+            assert (await cursor.fetchone())[0] == 'wal'
+        async with db.execute("PRAGMA synchronous") as cursor:
+            assert (await cursor.fetchone())[0] == 1  # NORMAL
+        async with db.execute("PRAGMA temp_store") as cursor:
+            assert (await cursor.fetchone())[0] == 2  # MEMORY
+        with pytest.raises(sqlite3.OperationalError):
+            await db.execute("DELETE FROM users")
+
+@pytest.mark.asyncio
+async def test_readers_run_during_write(test_db):
+    """Test readers see committed rows while the writer holds an open transaction"""
+    await test_db.register_user(discord_id=1, steam_id="76561198000000001")
+
+    async with test_db.writer() as db:
+        await db.execute("INSERT INTO users (discord_id, steam_id) VALUES (2, '76561198000000002')")
+        results = await asyncio.gather(test_db.get_steam_id(1), test_db.get_steam_id(2))
+        await db.commit()
+
+    assert results == ["76561198000000001", None]
+    assert await test_db.get_steam_id(2) == "76561198000000002"
+
+@pytest.mark.asyncio
+async def test_failed_write_is_rolled_back(test_db):
+    """Test an error inside the writer leaves no partial transaction behind"""
+    with pytest.raises(RuntimeError):
+        async with test_db.writer() as db:
+            await db.execute("INSERT INTO users (discord_id, steam_id) VALUES (3, '76561198000000003')")
+            raise RuntimeError("boom")
+
+    assert await test_db.register_user(discord_id=4, steam_id="76561198000000004")
+    assert await test_db.get_user(3) is None
+
+@pytest.mark.asyncio
+async def test_concurrent_writes_share_one_commit(test_db):
+    """Test a burst of registrations is committed as one transaction"""
+    statements = []
+    for connection in test_db._connections:
+        await connection.set_trace_callback(statements.append)
+
+    results = await asyncio.gather(*[
+        test_db.register_user(discord_id, f"7656119800000{discord_id:04d}")
+        for discord_id in range(50)
+    ])
+
+    assert all(results)
+    assert statements.count('COMMIT') == 1
+    assert await test_db.get_steam_id(49) == "76561198000000049"
+
+@pytest.mark.asyncio
+async def test_failed_write_does_not_undo_its_batch(test_db):
+    """Test a write that fails is rolled back alone while the rest of its batch commits"""
+    await test_db.register_user(1, "76561198000000001")
+
+    results = await asyncio.gather(
+        test_db.register_user(2, "76561198000000002"),
+        test_db.register_user(3, "76561198000000001"),  # Steam ID already linked
+        test_db.add_price_alert(2, 570, "Dota 2", 9.99)
+    )
+
+    assert results[:2] == [True, False]
+    assert await test_db.get_steam_id(2) == "76561198000000002"
+    assert await test_db.get_steam_id(3) is None
+    assert len(await test_db.get_user_alerts(2)) == 1
+
+@pytest.mark.asyncio
+async def test_close_flushes_queued_writes(test_db):
+    """Test writes still queued at shutdown are committed before the pool closes"""
+    writes = [
+        asyncio.create_task(test_db.create_lfg_post(5, discord_id, "Dota 2"))
+        for discord_id in range(10)
+    ]
+    await asyncio.sleep(0)
+
+    await test_db.close()
+
+    assert sorted(await asyncio.gather(*writes)) == list(range(1, 11))
+    assert len(await test_db.get_active_lfg_posts(5)) == 10
+
 @pytest.mark.asyncio
 async def test_create_game_event(test_db):
     """Test creating a game event"""
@@ -162,3 +364,128 @@ async def test_lfg_posts(test_db):
     posts = await test_db.get_active_lfg_posts(987654321)
     assert len(posts) == 1
     assert posts[0]['game_name'] == "Dota 2"
+
+@pytest.mark.asyncio
+async def test_user_preferences(test_db):
+    """Test preferences are stored on first set and merged on later ones"""
+    await test_db.set_user_preferences(123456789, preferred_genres=['Action'], playtime_threshold=5)
+    await test_db.set_user_preferences(123456789, language='de')
+
+    preferences = await test_db.get_user_preferences(123456789)
+    assert preferences['preferred_genres'] == ['Action']
+    assert preferences['playtime_threshold'] == 5
+    assert preferences['language'] == 'de'
+
+@pytest.mark.asyncio
+async def test_migrations_add_indexes_to_existing_databases():
+    """Test a database created before the migrations is brought up to the latest version once"""
+    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.db')
+    temp_file.close()
+    with sqlite3.connect(temp_file.name) as legacy:
+        legacy.executescript(SCHEMA)
+
+    db = Database(temp_file.name)
+    await db.initialize()
+    try:
+        assert await db.migrate() == MIGRATIONS[-1][0]
+        async with db.reader() as conn:
+            async with conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'idx_%'"
+            ) as cursor:
+                indexes = {row[0] for row in await cursor.fetchall()}
+        assert 'idx_price_alerts_active' in indexes
+        assert 'idx_user_games_appid' in indexes
+    finally:
+        await db.close()
+        os.unlink(temp_file.name)
+
+@pytest.mark.asyncio
+async def test_json_columns_migrated_to_join_tables():
+    """Test JSON list values from before migration 3 read back the same from the join tables"""
+    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.db')
+    temp_file.close()
+    with sqlite3.connect(temp_file.name) as legacy:
+        legacy.executescript(SCHEMA)
+        legacy.execute(
+            """INSERT INTO game_events (guild_id, game_name, scheduled_time, created_by, participants)
+               VALUES (5, 'Dota 2', datetime('now', '+1 day'), 1, '[3, 2]')"""
+        )
+        legacy.execute(
+            """INSERT INTO game_metadata (appid, name, genres, categories, multiplayer_types)
+               VALUES (570, 'Dota 2', '["Strategy", "Action"]', '[1, 36]', '["multiplayer", "competitive"]')"""
+        )
+        legacy.execute("INSERT INTO user_preferences (discord_id, preferred_genres) VALUES (1, '[\"RPG\"]')")
+
+    db = Database(temp_file.name)
+    await db.initialize()
+    try:
+        events = await db.get_upcoming_events(5, discord_id=2)
+        metadata = await db.get_game_metadata(570)
+        preferences = await db.get_user_preferences(1)
+
+        assert [json.loads(event['participants']) for event in events] == [[3, 2]]
+        assert metadata['genres'] == ["Strategy", "Action"]
+        assert metadata['categories'] == [1, 36]
+        assert metadata['multiplayer_types'] == ["multiplayer", "competitive"]
+        assert preferences['preferred_genres'] == ["RPG"]
+        assert await db.get_game_categories() == {570: [1, 36]}
+    finally:
+        await db.close()
+        os.unlink(temp_file.name)
+
+@pytest.mark.asyncio
+async def test_event_participants(test_db):
+    """Test events can be listed for one member, as creator or participant"""
+    tomorrow = datetime.now() + timedelta(days=1)
+    await test_db.create_game_event(5, "Dota 2", tomorrow, created_by=1, participants=[1, 2])
+    await test_db.create_game_event(5, "CS:GO", tomorrow + timedelta(hours=1), created_by=3)
+
+    assert [e['game_name'] for e in await test_db.get_upcoming_events(5)] == ["Dota 2", "CS:GO"]
+    assert [e['game_name'] for e in await test_db.get_upcoming_events(5, discord_id=2)] == ["Dota 2"]
+    assert [e['game_name'] for e in await test_db.get_upcoming_events(5, discord_id=3)] == ["CS:GO"]
+    assert [e['game_name'] for e in await test_db.get_upcoming_events(5, discord_id=4)] == []
+
+@pytest.mark.asyncio
+async def test_game_metadata_lists_replaced_in_order(test_db):
+    """Test re-caching metadata replaces each list and keeps its order"""
+    await test_db.cache_game_metadata(570, {'name': 'Dota 2', 'genres': ['Strategy', 'Action'], 'categories': [36, 1]})
+    await test_db.cache_game_metadata(570, {'name': 'Dota 2', 'genres': ['Free to Play', 'Strategy'], 'categories': [1]})
+    await test_db.cache_game_metadata(730, {'name': 'CS2'})
+
+    metadata = await test_db.get_game_metadata(570)
+    assert metadata['genres'] == ['Free to Play', 'Strategy']
+    assert metadata['categories'] == [1]
+    assert metadata['multiplayer_types'] == []
+    assert await test_db.get_game_categories() == {570: [1], 730: []}
+
+@pytest.mark.asyncio
+async def test_every_query_uses_an_index(test_db):
+    """Test EXPLAIN QUERY PLAN shows no full table scan for any Database query"""
+    public = {
+        name for name, _ in inspect.getmembers(Database, inspect.iscoroutinefunction)
+        if not name.startswith('_')
+    } - {'initialize', 'migrate', 'close'}
+    assert public == {name for name, _ in DATABASE_CALLS}
+
+    statements = []
+    for connection in test_db._connections:
+        await connection.set_trace_callback(statements.append)
+
+    scans = []
+    for name, call in DATABASE_CALLS:
+        statements.clear()
+        await call(test_db)
+        queries = [
+            sql for sql in statements
+            if sql.lstrip().split(None, 1)[0].upper() in ('SELECT', 'INSERT', 'UPDATE', 'DELETE')
+        ]
+        assert queries, name
+        for sql in queries:
+            async with test_db.writer() as db:
+                async with db.execute(f"EXPLAIN QUERY PLAN {sql}") as cursor:
+                    plan = [row[3] for row in await cursor.fetchall()]
+            full_scans = [step for step in plan if re.fullmatch(r'SCAN \w+', step)]
+            if full_scans and name not in FULL_TABLE_READS:
+                scans.append((name, full_scans, sql))
+
+    assert scans == []
@@ -1,6 +1,8 @@
 # ----- required imports -----
 
 import pytest
+import src.matchmaking as matchmaking_module
+from src.api import SteamAPI
 from src.matchmaking import MatchmakingEngine
 
 # ----- test fixtures -----
@@ -92,3 +94,25 @@ def test_format_compatibility_message(matchmaking_engine):
     assert "82.1%" in message
     assert "User1" in message
     assert "User2" in message
+
+@pytest.mark.asyncio
+async def test_failed_member_libraries_are_skipped(matchmaking_engine, fake_upstream, test_db, monkeypatch):
+    """Test a member whose library fails is left out instead of failing the whole scan"""
+    monkeypatch.setattr(matchmaking_module, "db", test_db)
+    monkeypatch.setattr(matchmaking_module, "MATCHMAKING_BATCH_SIZE", 1)
+    for discord_id in (1, 2, 3):
+        await test_db.register_user(discord_id, f"7656119800000000{discord_id}", f"user{discord_id}")
+
+    async def fetch_owned_games(steam_id):
+        if steam_id == "76561198000000002":
+            raise RuntimeError("profile unavailable")
+        return [{'appid': 570, 'name': 'Dota 2', 'playtime_forever': 600}]
+
+    monkeypatch.setattr(SteamAPI, "_fetch_owned_games", staticmethod(fetch_owned_games))
+
+    matches = await matchmaking_engine.find_best_matches(1, [2, 3])
+    players = await matchmaking_engine.find_players_for_game("dota", [1, 2, 3])
+
+    assert [member_id for member_id, _ in matches] == [3]
+    assert matches[0][1]['shared_games'] == 1
+    assert sorted(member_id for member_id, _ in players) == [1, 3]
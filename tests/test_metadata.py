@@ -0,0 +1,113 @@
+# ----- required imports -----
+
+import pytest
+from src.metadata import CapabilityIndex, MetadataIngestor, extract_metadata, parse_release_date
+
+# ----- test fixtures -----
+
+APPDETAILS_PATH = '/api/appdetails'
+
+# ----- tests -----
+
+def test_extract_metadata_from_appdetails():
+    """Test genres, categories, multiplayer types, release date and score are extracted"""
+    metadata = extract_metadata({
+        'steam_appid': 550,
+        'name': 'Left 4 Dead 2',
+        'genres': [{'id': '1', 'description': 'Action'}],
+        'categories': [{'id': 2, 'description': 'Single-player'}, {'id': 38, 'description': 'Online Co-op'},
+                       {'id': 1, 'description': 'Multi-player'}],
+        'release_date': {'coming_soon': False, 'date': '16 Nov, 2009'},
+        'metacritic': {'score': 89}
+    })
+
+    assert metadata == {
+        'name': 'Left 4 Dead 2',
+        'genres': ['Action'],
+        'categories': [1, 2, 38],
+        'multiplayer_types': ['multiplayer', 'coop', 'online_coop'],
+        'release_date': '2009-11-16',
+        'metacritic_score': 89
+    }
+
+def test_parse_release_date_keeps_unparseable_text():
+    """Test localized dates are normalized and placeholders kept as-is"""
+    assert parse_release_date({'date': 'Aug 21, 2012'}) == '2012-08-21'
+    assert parse_release_date({'date': 'Coming soon'}) == 'Coming soon'
+    assert parse_release_date({'date': ''}) is None
+
+@pytest.mark.asyncio
+async def test_ingest_fills_missing_metadata(fake_upstream, test_db):
+    """Test one pass stores every library appid without metadata, in batches"""
+    await test_db.cache_user_games("76561198000000001", [
+        {'appid': 10, 'name': 'Game 10'},
+        {'appid': 20, 'name': 'Game 20'},
+        {'appid': 10 ** 7, 'name': 'Delisted'}
+    ])
+    await test_db.cache_user_games("76561198000000002", [
+        {'appid': 20, 'name': 'Game 20'},
+        {'appid': 30, 'name': 'Game 30'}
+    ])
+    ingestor = MetadataIngestor(test_db, index=CapabilityIndex(), batch_size=2)
+
+    assert await ingestor.ingest_pending() == 3
+
+    metadata = await test_db.get_game_metadata(20)
+    assert metadata['name'] == 'Game 20'
+    assert metadata['categories']
+    assert await test_db.get_game_metadata(10 ** 7) is None
+    assert ingestor.unknown_appids == {10 ** 7}
+
+    # Nothing left to fetch; the delisted app is not retried
+    assert await ingestor.ingest_pending() == 0
+    assert fake_upstream.requests[APPDETAILS_PATH] == 4
+
+def test_capability_index_filters_by_every_mode():
+    """Test games must match all filters and unindexed games are reported separately"""
+    index = CapabilityIndex()
+    index.update({
+        10: {'categories': [1, 38]},
+        20: {'categories': [2]},
+        30: {'categories': [1, 36, 47]}
+    })
+    games = [{'appid': appid} for appid in (10, 20, 30, 40)]
+
+    matches, unknown = index.filter(games, ['multiplayer'])
+    assert [game['appid'] for game in matches] == [10, 30]
+    assert unknown == [40]
+
+    matches, _ = index.filter(games, ['competitive', 'lan'])
+    assert [game['appid'] for game in matches] == [30]
+
+@pytest.mark.asyncio
+async def test_capability_index_loads_from_database(test_db):
+    """Test the index is rebuilt from stored game_metadata categories"""
+    await test_db.cache_game_metadata_many({
+        10: {'name': 'Game 10', 'categories': [38]},
+        20: {'name': 'Game 20', 'categories': [2]}
+    })
+    index = CapabilityIndex()
+
+    await index.load(test_db)
+
+    assert len(index) == 2
+    matches, unknown = index.filter([{'appid': 10}, {'appid': 20}], ['online_coop'])
+    assert matches == [{'appid': 10}] and unknown == []
+
+@pytest.mark.asyncio
+async def test_enqueued_appids_are_fetched_first(fake_upstream, test_db):
+    """Test requested appids resolve even when no cached library contains them"""
+    index = CapabilityIndex()
+    ingestor = MetadataIngestor(test_db, index=index)
+
+    ingestor.enqueue([10, 10 ** 7])
+    ingestor.enqueue([10])
+
+    assert await ingestor.ingest_pending() == 1
+    assert 10 in index
+    assert ingestor.unknown_appids == {10 ** 7}
+
+    # Already resolved either way, so nothing is queued again
+    ingestor.enqueue([10, 10 ** 7])
+    assert await ingestor.ingest_pending() == 0
+    assert fake_upstream.requests[APPDETAILS_PATH] == 2
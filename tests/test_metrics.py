@@ -0,0 +1,34 @@
+# ----- required imports -----
+
+import pytest
+from src.metrics import Histogram
+
+# ----- tests -----
+
+def test_histogram_percentiles():
+    """Test percentiles resolve to bucket upper bounds"""
+    histogram = Histogram([1, 10, 100])
+    for value in [0.5] * 50 + [5] * 45 + [50] * 5:
+        histogram.observe(value)
+
+    assert histogram.count == 100
+    assert histogram.percentile(0.50) == 1
+    assert histogram.percentile(0.95) == 10
+    assert histogram.percentile(0.99) == 50  # capped at the largest observation
+
+def test_histogram_overflow_bucket():
+    """Test values above the last bucket are still counted"""
+    histogram = Histogram([1, 10])
+    histogram.observe(500)
+
+    snapshot = histogram.snapshot()
+    assert snapshot['buckets']['+Inf'] == 1
+    assert snapshot['p50'] == 500
+    assert snapshot['mean'] == 500
+
+def test_empty_histogram_snapshot():
+    """Test an empty histogram reports zeros"""
+    snapshot = Histogram([1, 10]).snapshot()
+
+    assert snapshot['count'] == 0
+    assert snapshot['p95'] == 0.0